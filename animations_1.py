@@ -3,44 +3,233 @@
 """
 Created on Wed Apr 27 22:21:43 2022
 
+Render the map animations and dashboard figures of every offense code group to
+standalone HTML (or JSON) files for the nightly reports, without opening a browser.
+The dataset is loaded and cleaned once, groups are rendered in parallel on a process
+pool, and groups whose incidents did not change since the last run are skipped
+
+    python animations_1.py --out-dir reports --format html --workers 4
+
 @author: anandafrancis
 """
 
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
 from crime_dash_library import CrimeReport
-import plotly.express as px
-import random as r
 
-# intialize class
-cr = CrimeReport()
 
-# load all csvs into class
-for num in range(15,23):
-    cr.load_report(f'crime_20{num}.csv')
+MANIFEST = 'manifest.json'
 
-# clean dataframe
-cr.clean_data(title_case_cols=['offense_code_group', 'street'],
-          no_nan_cols=['street', 'offense_code_group', 'district'], 
-          del_cols=['reporting_area', 'occurred_on_date', 'ucr_part', 'location'])
+# manifest key of the yearly bar charts, which do not belong to one offense code group
+BAR_CHARTS = '_bar_charts'
 
-# choose random offense code group to make visualization
-offense = r.choice(cr.data['offense_code_group'].unique())
+# columns the rendered figures read, a group is re-rendered only when these change
+RENDER_COLS = ['offense_code_group', 'offense_description', 'district', 'lat', 'long',
+               'year', 'month', 'day_of_week', 'hour', 'mon_yr', 'day_mon_yr']
 
-# load mapbox key for visualizations 
+# load mapbox key for visualizations
 act = 'pk.eyJ1IjoiYW5hbmRhZnJhbmNpcyIsImEiOiJjbDJldDk4NW0wM3lkM2tubHhkMjhhN254In0.MCN_0yxCGqGSNI6n121X0w'
-px.set_mapbox_access_token(act)
-
-year_animation = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('year'), 
-                               lat='lat', lon='long', animation_frame='year', color='district', 
-                               title=f'{offense} Occurences by Year from 2015 to 2022')
-                
-month_aniamtion = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('mon_yr'), 
-                               lat='lat', lon='long', animation_frame='mon_yr', color='district', 
-                               title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
-                
-day_animation = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('day_mon_yr'), 
-                               lat='lat', lon='long', animation_frame='day_mon_yr', color='district', 
-                               title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
-
-year_animation.show()
-month_animation.show()
-day_animation.show()
\ No newline at end of file
+
+
+def slug(offense):
+    ''' Directory name of an offense code group '''
+    return re.sub(r'[^a-z0-9]+', '_', offense.lower()).strip('_')
+
+
+def group_dirs(offenses):
+    '''
+    Purpose:
+        name the output directory of every offense code group, suffixing groups whose names
+        only differ in punctuation or case (like "M/V Accident" and "M V Accident") with a hash
+        of the name so they never overwrite each other
+
+    Args:
+        offenses (list): offense code groups
+
+    Return:
+        dict of offense code group to directory name
+    '''
+
+    slugs = {offense: slug(offense) for offense in offenses}
+    taken = Counter(slugs.values())
+    return {offense: name if taken[name] == 1 else f'{name}_{hashlib.sha1(offense.encode()).hexdigest()[:8]}'
+            for offense, name in slugs.items()}
+
+
+def group_fingerprints(data, fmt):
+    '''
+    Purpose:
+        hash the incidents of every offense code group in one pass, so unchanged groups can be skipped
+
+    Args:
+        data (DataFrame): cleaned crime reports
+        fmt (str): output format, part of the fingerprint since it changes the files written
+
+    Return:
+        dict of offense code group to hex digest
+    '''
+
+    # row hashes are computed once for the whole dataframe, then combined per group
+    hashed = pd.util.hash_pandas_object(data[RENDER_COLS], index=False).to_numpy()
+    codes, groups = pd.factorize(data['offense_code_group'])
+    order = codes.argsort(kind='stable')
+    bounds = codes[order].searchsorted(range(len(groups) + 1))
+
+    return {offense: hashlib.sha1(hashed[order[bounds[num]:bounds[num + 1]]].tobytes() + fmt.encode()).hexdigest()
+            for num, offense in enumerate(groups)}
+
+
+def _read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(out_dir, manifest):
+    ''' Atomically replace the manifest so an interrupted run keeps the groups already rendered '''
+    path = os.path.join(out_dir, MANIFEST)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def render_bar_charts(cr, out_dir, fmt):
+    '''
+    Purpose:
+        render the bar chart of offense code groups for every year
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        out_dir (str): directory to write the charts to
+        fmt (str): html or json
+
+    Return:
+        None, writes one file per year
+    '''
+
+    import plotly.io as pio
+    from figures import make_bar_chart
+
+    crime_year_offense = cr.year_offense_counts()
+    for year in crime_year_offense.index.get_level_values('year').unique():
+        bar_chart = make_bar_chart(crime_year_offense.loc[year], year)
+        path = os.path.join(out_dir, f'bar_{year}.{fmt}')
+        if fmt == 'html':
+            pio.write_html(bar_chart, path, include_plotlyjs='cdn')
+        else:
+            pio.write_json(bar_chart, path)
+
+
+def render_all(cr, out_dir, fmt='html', workers=None, offenses=None, force=False):
+    '''
+    Purpose:
+        render every offense code group whose incidents changed since the last run on a process pool
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        out_dir (str): directory to write the figures to, one subdirectory per group
+        fmt (str): html or json
+        workers (int): number of worker processes, None uses every core
+        offenses (list): offense code groups to render, None renders all groups
+        force (bool): render groups even if they are unchanged
+
+    Return:
+        dict of offense code group to files written, only for the groups rendered, raises
+        RuntimeError naming the groups that failed once every other group is rendered
+    '''
+
+    from jobs import _init_worker, render_job
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _read_manifest(out_dir)
+    fingerprints = group_fingerprints(cr.data, fmt)
+    dirs = group_dirs(fingerprints)
+
+    todo = [offense for offense in fingerprints
+            if (offenses is None or offense in offenses)
+            and (force or manifest.get(offense) != fingerprints[offense]
+                 or not os.path.isdir(os.path.join(out_dir, dirs[offense])))]
+    print(f'rendering {len(todo)} of {len(fingerprints)} offense code groups', flush=True)
+
+    # bar charts depend on every group, so they are re-rendered when any group changed
+    bars = hashlib.sha1(''.join(sorted(fingerprints.values())).encode()).hexdigest()
+    if force or manifest.get(BAR_CHARTS) != bars:
+        render_bar_charts(cr, out_dir, fmt)
+        manifest[BAR_CHARTS] = bars
+        _write_manifest(out_dir, manifest)
+
+    if not todo:
+        return {}
+
+    # workers share one cleaned dataset read from disk instead of each cleaning the csv files
+    data_path = os.path.join(out_dir, 'data.pkl')
+    cr.data.to_pickle(data_path)
+
+    written, failed = {}, {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data_path, act)) as pool:
+            futures = {pool.submit(render_job, offense, os.path.join(out_dir, dirs[offense]), fmt): offense
+                       for offense in todo}
+            for future in as_completed(futures):
+                offense = futures[future]
+
+                # a failed group is reported and left out of the manifest, so the next run retries it
+                try:
+                    written[offense] = future.result()
+                except Exception as error:
+                    failed[offense] = error
+                    print(f'failed {offense}: {error!r}', flush=True)
+                    continue
+
+                # record each group as soon as it is done
+                manifest[offense] = fingerprints[offense]
+                _write_manifest(out_dir, manifest)
+                print(f'rendered {offense}', flush=True)
+    finally:
+        os.remove(data_path)
+
+    if failed:
+        raise RuntimeError(f'failed to render {len(failed)} of {len(todo)} offense code groups: {", ".join(sorted(failed))}')
+    return written
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Render crime map animations and dashboard figures for every offense code group')
+    parser.add_argument('--data-dir', default='.', help='directory of the crime_20XX.csv files')
+    parser.add_argument('--out-dir', default='reports', help='directory to write the figures to')
+    parser.add_argument('--format', choices=['html', 'json'], default='html', help='standalone html pages or figure json')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--offense', action='append', help='offense code group to render, may be repeated')
+    parser.add_argument('--force', action='store_true', help='render groups even if they are unchanged')
+    args = parser.parse_args()
+
+    # intialize class
+    cr = CrimeReport()
+
+    # load all csvs into class
+    for num in range(15,23):
+        cr.load_report(os.path.join(args.data_dir, f'crime_20{num}.csv'))
+
+    # clean dataframe
+    cr.clean_data(title_case_cols=['offense_code_group', 'street'],
+              no_nan_cols=['street', 'offense_code_group', 'district'],
+              del_cols=['reporting_area', 'occurred_on_date', 'ucr_part', 'location'])
+    print(cr.quality_report(), flush=True)
+
+    render_all(cr, args.out_dir, args.format, args.workers, args.offense, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+@file: bench_backend.py
+
+Benchmark the dashboard queries on the pandas CrimeReport against the SQL backend
+on a synthetic dataset, e.g. python bench_backend.py 1000000
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from crime_dash_library import CrimeReport, DAYS
+from crime_sql import SQLCrimeReport
+
+
+def synthetic_data(rows, seed=0):
+    '''
+    Purpose:
+        generate cleaned looking crime reports with realistic cardinalities
+
+    Args:
+        rows (int): number of crime reports
+        seed (int): random seed
+
+    Return:
+        dataframe of crime reports
+    '''
+
+    rng = np.random.default_rng(seed)
+    groups = np.array([f'Offense Group {num}' for num in range(60)])
+    districts = np.array(['A1', 'A15', 'A7', 'B2', 'B3', 'C6', 'C11', 'D4', 'D14', 'E5', 'E13', 'E18'])
+    streets = np.array([f'Street {num}' for num in range(5000)])
+
+    # skewed offense and street frequencies like the real reports
+    group_p = 1 / np.arange(1, len(groups) + 1)
+    street_p = 1 / np.arange(1, len(streets) + 1)
+    datetimes = pd.Timestamp('2015-06-01') + pd.to_timedelta(rng.integers(0, 7 * 365 * 24 * 60, rows), unit='min')
+
+    return pd.DataFrame({
+        'incident_number': np.arange(rows).astype(str),
+        'offense_code_group': rng.choice(groups, rows, p=group_p / group_p.sum()),
+        'offense_description': rng.choice(groups, rows),
+        'district': rng.choice(districts, rows),
+        'street': rng.choice(streets, rows, p=street_p / street_p.sum()),
+        'year': datetimes.year,
+        'month': datetimes.month,
+        'day_of_week': np.array(DAYS)[(datetimes.dayofweek.to_numpy() + 1) % 7],
+        'hour': datetimes.hour,
+        'lat': rng.uniform(42.2, 42.4, rows),
+        'long': rng.uniform(-71.2, -71.0, rows),
+        'datetime': datetimes,
+    })
+
+
+def _time(fn, repeat=5):
+    ''' Best wall time of a few runs in milliseconds '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(rows=1000000):
+
+    data = synthetic_data(rows)
+
+    backends = {'pandas': CrimeReport(), 'sql': SQLCrimeReport()}
+    for cr in backends.values():
+        cr.data = data
+
+    start = time.perf_counter()
+    backends['sql'].build_database(':memory:')
+    print(f"{rows} rows, {backends['sql'].engine} database built in {time.perf_counter() - start:.2f}s")
+
+    offenses = ['Offense Group 0', 'Offense Group 3', 'Offense Group 10']
+    streets = ['Street 0', 'Street 1', 'Street 42']
+    queries = {
+        'year filter (map rows)': lambda cr: cr.incidents(2018, None, ['lat', 'long', 'incident_number']),
+        'year + offense filter': lambda cr: cr.incidents(2018, offenses, ['lat', 'long', 'incident_number']),
+        'offense groups in year': lambda cr: cr.offense_groups(2018),
+        'street/offense pairs (all)': lambda cr: cr.street_offense_counts(2018, None, None, 15),
+        'street/offense pairs (filtered)': lambda cr: cr.street_offense_counts(2018, streets, offenses, 0),
+        'month/day/hour histograms': lambda cr: cr.histograms(2018, offenses),
+    }
+
+    print(f"{'query':35}" + ''.join(f'{name:>12}' for name in backends))
+    for label, query in queries.items():
+        times = [_time(lambda: query(cr)) for cr in backends.values()]
+        print(f'{label:35}' + ''.join(f'{ms:>10.1f}ms' for ms in times))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
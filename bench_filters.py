@@ -0,0 +1,117 @@
+"""
+@file: bench_filters.py
+
+Regression benchmark for the shared filter resolution in update_charts. Builds the map and
+line chart inputs of one callback by filtering per figure, as the callback used to, and through
+RowSelection, counting dataframe copies, filter mask passes, peak memory and time of each,
+e.g. python bench_filters.py 1000000
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+import figure_templates as ft
+from bench_backend import synthetic_data
+from crime_dash_library import CrimeReport
+from filters import RowSelection
+
+
+@contextmanager
+def _count_calls(owner, name, counts, key, when=lambda obj: True):
+    ''' Count calls to a method while the block runs '''
+    original = getattr(owner, name)
+
+    def counted(self, *args, **kwargs):
+        if when(self):
+            counts[key] += 1
+        return original(self, *args, **kwargs)
+
+    setattr(owner, name, counted)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
+def per_figure(cr, year, offenses):
+    ''' Each figure filters its own copy of the reports, like update_charts did before RowSelection '''
+    groups = cr.data.loc[cr._mask(year), 'offense_code_group'].unique().tolist()
+    crime = cr.data.loc[cr._mask(year, offenses), ft.MAP_COLS]
+    ft.map_chart(crime)
+    ft.line_chart(cr.histograms(year, offenses), "")
+    return groups
+
+
+def resolved(cr, year, offenses):
+    ''' Filters resolved once per request and shared as row positions '''
+    rows = RowSelection(cr)
+    groups = rows.offense_groups(year)
+    ft.map_chart(rows.columns(ft.MAP_COLS, year, offenses))
+    ft.line_chart(rows.histograms(year, offenses), "")
+    return groups
+
+
+def measure(fn, cr, year, offenses):
+    '''
+    Purpose:
+        run one callback's filtering and count what it allocates
+
+    Args:
+        fn (function): per_figure or resolved
+        cr (CrimeReport): crime reports
+        year (int): year selected
+        offenses (list): offense code groups selected, None for all
+
+    Return:
+        dict of dataframes created, mask passes, peak MB allocated and milliseconds taken
+    '''
+
+    counts = {'frames': 0, 'masks': 0}
+    with _count_calls(pd.DataFrame, '__finalize__', counts, 'frames', lambda obj: isinstance(obj, pd.DataFrame)), \
+         _count_calls(CrimeReport, '_mask', counts, 'masks'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(cr, year, offenses)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return dict(counts, peak_mb=peak / 2 ** 20, ms=elapsed * 1000)
+
+
+def main(rows=1000000):
+
+    cr = CrimeReport()
+    cr.data = synthetic_data(rows)
+
+    # build the figure templates outside the measurements
+    ft.map_chart(cr.data.iloc[:0])
+    ft.line_chart(cr.histograms(None, []), "")
+
+    cases = {'all offense groups': None, 'three offense groups': ['Offense Group 0', 'Offense Group 3', 'Offense Group 10']}
+
+    print(f"{rows} rows")
+    print(f"{'case':22}{'path':12}{'frames':>8}{'masks':>7}{'peak MB':>10}{'time':>10}")
+    failed = False
+    for label, offenses in cases.items():
+        results = {name: measure(fn, cr, 2018, offenses) for name, fn in [('per figure', per_figure), ('resolved', resolved)]}
+        for name, result in results.items():
+            print(f"{label:22}{name:12}{result['frames']:>8}{result['masks']:>7}{result['peak_mb']:>10.1f}{result['ms']:>8.1f}ms")
+
+        # regression check, resolving filters once must copy fewer frames and mask less
+        if results['resolved']['frames'] >= results['per figure']['frames'] or results['resolved']['masks'] >= results['per figure']['masks']:
+            failed = True
+
+    if failed:
+        print("regression: shared filter resolution no longer saves frame copies")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,79 @@
+"""
+@file: comparison.py
+
+Year over year comparison of crime counts. Count vectors by offense code group,
+district and hour are precomputed for every year, so comparing two years is a
+vector subtraction instead of filtering and grouping the reports twice
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# dimensions a comparison breaks counts down by
+DIMENSIONS = ['offense_code_group', 'district', 'hour']
+
+
+class YearCounts:
+
+    def __init__(self, data):
+        """Constructor"""
+
+        # years as rows of every count matrix
+        year_codes, self.years = pd.factorize(data['year'], sort=True)
+
+        # categories and (years, categories) count matrix per dimension, one bincount each
+        self.categories = {}
+        self.counts = {}
+        for dim in DIMENSIONS:
+            codes, categories = pd.factorize(data[dim], sort=True)
+            valid = codes >= 0
+            flat = year_codes[valid] * len(categories) + codes[valid]
+            counts = np.bincount(flat, minlength=len(self.years) * len(categories))
+            self.categories[dim] = categories
+            self.counts[dim] = counts.reshape(len(self.years), len(categories))
+
+    def year_vector(self, year, dim):
+        '''
+        Purpose:
+            counts of one year broken down by a dimension
+
+        Args:
+            year (int): year selected
+            dim (str): offense_code_group, district or hour
+
+        Return:
+            series of counts indexed by category
+        '''
+
+        return pd.Series(self.counts[dim][self.years.get_loc(year)], index=self.categories[dim], name=year)
+
+    def delta(self, year_a, year_b, dim):
+        '''
+        Purpose:
+            change in counts from one year to another broken down by a dimension
+
+        Args:
+            year_a (int): year compared from
+            year_b (int): year compared to
+            dim (str): offense_code_group, district or hour
+
+        Return:
+            dataframe of both years' counts, their difference and percent change per category
+        '''
+
+        counts = self.counts[dim]
+        a = counts[self.years.get_loc(year_a)]
+        b = counts[self.years.get_loc(year_b)]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = np.where(a > 0, (b - a) / a * 100, np.nan)
+
+        return pd.DataFrame({year_a: a, year_b: b, 'delta': b - a, 'pct_change': pct},
+                            index=self.categories[dim])
+
+    def deltas(self, year_a, year_b):
+        ''' Year over year deltas for every dimension '''
+        return {dim: self.delta(year_a, year_b, dim) for dim in DIMENSIONS}
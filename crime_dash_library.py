@@ -6,17 +6,94 @@ Created on Mon Apr 25 07:10:00 2022
 
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from functools import lru_cache
+import hashlib
 import re
 
+from result_cache import cached_result
+
+
+# street suffix abbreviations, only expanded when they end a street name
+STREET_SUFFIXES = {'ST': 'Street', 'AVE': 'Avenue', 'AV': 'Avenue', 'RD': 'Road', 'BLVD': 'Boulevard',
+                   'PL': 'Place', 'SQ': 'Square', 'HWY': 'Highway', 'PKWY': 'Parkway', 'DR': 'Drive',
+                   'CT': 'Court', 'TER': 'Terrace', 'LN': 'Lane', 'PK': 'Park', 'CIR': 'Circle',
+                   'EXPY': 'Expressway', 'WY': 'Way', 'TPKE': 'Turnpike', 'HTS': 'Heights', 'WHRF': 'Wharf'}
+
+# compass direction abbreviations, only expanded when they start a street name
+STREET_DIRECTIONS = {'N': 'North', 'S': 'South', 'E': 'East', 'W': 'West'}
+
+# order of days for the day of week histogram
+DAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+@lru_cache(maxsize=None)
+def canonical_street(name):
+    '''
+    Purpose:
+        standardize a raw street value into its component street names, expanding abbreviations
+        so that variants like "WASHINGTON ST" and "Washington Street." resolve to the same name
+
+    Args:
+        name (str): raw street value, possibly an intersection of streets joined by "&"
+
+    Return:
+        tuple of canonical street names, one per component street of an intersection
+    '''
+
+    # remove zip code, city and state from location
+    name = name.split('\n')[0]
+
+    streets = []
+    for part in name.split('&'):
+        # drop punctuation and repeated whitespace
+        tokens = re.sub(r'[.,]', ' ', part).upper().split()
+        if len(tokens) == 0:
+            continue
+
+        # expand leading direction and trailing suffix, "ST" at the start of a name is saint
+        # a lone direction before a suffix is a letter street, so "E ST" stays apart from "East Street"
+        letter_street = len(tokens) == 2 and tokens[1] in STREET_SUFFIXES
+        if len(tokens) > 1 and tokens[0] in STREET_DIRECTIONS and not letter_street:
+            tokens[0] = STREET_DIRECTIONS[tokens[0]]
+        elif len(tokens) > 1 and tokens[0] == 'ST':
+            tokens[0] = 'Saint'
+        if len(tokens) > 1 and tokens[-1] in STREET_SUFFIXES:
+            tokens[-1] = STREET_SUFFIXES[tokens[-1]]
+
+        # numbered streets keep lowercase ordinals (1st, 2nd)
+        streets.append(' '.join(tok.lower() if tok[0].isdigit() else tok.title() for tok in tokens))
+
+    return tuple(streets)
+
+
 class CrimeReport:
     
+    # query methods can take precomputed row positions instead of recomputing their filter mask
+    positional = True
+    
     def __init__(self):
         """Constructor"""
         
         # intialize dataframe to merge all registered crime reports to
         self.data = pd.DataFrame()
         
+        # canonical street names by street id, filled by clean_data
+        self.streets = pd.Series(dtype=object, name='street')
+        
+        # loaded files and the file each row came from, as positions into self.sources
+        self.sources = []
+        self._source_codes = np.empty(0, dtype=np.int16)
+        
+        # rows rejected by each validation rule per source file, filled by clean_data
+        self.quality = pd.DataFrame()
+        
+        # shared on-disk cache of query results and the fingerprint of the data they were computed from
+        self.results = None
+        self.results_fingerprint = None
+        
+        # set once compact stores strings as categoricals
+        self.compacted = False
+        
         
     
     def load_report(self, file): 
@@ -38,33 +115,69 @@ class CrimeReport:
         # merge pandas with previously loaded csv
         self.data = pd.concat([self.data, df], axis=0)
         
+        # remember which file the rows came from for the quality report
+        self.sources.append(str(file))
+        self._source_codes = np.concatenate([self._source_codes, np.full(len(df), len(self.sources) - 1, dtype=np.int16)])
+        
     
-    def _assign_offcode_group(self):
+    def fingerprint(self):
         '''
         Purpose:
-            for all nan values, assign the appropriate offense group based on offense code of crime
+            hash the contents of the loaded dataframe to tell whether derived results are still valid
             
         Args:
             None
             
         Return:
-            dataframe with no nan values in offense code group
+            str hex digest of the dataframe contents
         '''
         
-        # create dict with keys as offense code groups and values as list of corresponding codes
-        off_codes = {off: list(self.data[self.data.offense_code_group == off].offense_code.unique()) 
-                     for off in self.data['offense_code_group'].unique()}
+        # hash integers at full width so a compacted dataframe keeps the same fingerprint
+        ints = {col: np.int64 for col in self.data.columns if pd.api.types.is_integer_dtype(self.data[col])}
+        hashed = pd.util.hash_pandas_object(self.data.astype(ints), index=False)
+        return hashlib.sha1(hashed.values.tobytes()).hexdigest()
+    
+    def use_results(self, cache, fingerprint=None):
+        '''
+        Purpose:
+            serve the aggregate queries from a result cache shared with other processes,
+            once the data is cleaned since results are keyed by its fingerprint
+            
+        Args:
+            cache (ResultCache): on-disk result cache, None stops caching
+            fingerprint (str): fingerprint of the data if already computed
+            
+        Return:
+            None, sets the cache
+        '''
         
-        # reverse the dictionary so that keys are the codes and values are its corresponding offense code group 
-        pairs = {code: off for off in off_codes.keys() for code in off_codes[off]}
+        self.results = cache
+        self.results_fingerprint = None if cache is None else fingerprint or self.fingerprint()
+    
+    def _assign_offcode_group(self, valid):
+        '''
+        Purpose:
+            for all nan values, assign the appropriate offense group based on offense code of crime
+            
+        Args:
+            valid (ndarray): boolean mask of the rows that passed the earlier validation rules
+            
+        Return:
+            tuple of the offense code group of every row and a boolean mask of the rows whose
+            offense code has no known offense code group
+        '''
         
-        # remove any offense code without offense code group
-        self.data = self.data[self.data.offense_code.isin(pairs.keys())]
+        # offense code to offense code group pairs seen in valid rows, a code listed under several
+        # groups keeps the group whose first appearance in the data is latest
+        group_codes, _ = pd.factorize(self.data['offense_code_group'])
+        pairs = pd.DataFrame({'code': self.data['offense_code'].to_numpy(), 'group': self.data['offense_code_group'].to_numpy(),
+                              'rank': group_codes})[valid & (group_codes >= 0)]
+        pairs = pairs.drop_duplicates(['code', 'group']).sort_values('rank', kind='stable').drop_duplicates('code', keep='last')
         
-        # mend dataframe
-        self.data['offense_code_group'] = self.data.apply(lambda row: pairs[row.offense_code], axis=1)
+        # look up every row's group at once, codes without a group come back as nan
+        groups = self.data['offense_code'].map(pd.Series(pairs['group'].to_numpy(), index=pairs['code'].to_numpy()))
         
-        return self.data
+        return groups.to_numpy(), groups.isna().to_numpy()
         
     def clean_data(self, lowercase_cols=True, min_lat=42, fix_shootings=True, title_case_cols=[], offcodegroup_needed=True, 
                    no_nan_cols=[], fix_time=True, del_cols=[], fix_streets=True):
@@ -91,14 +204,26 @@ class CrimeReport:
         if lowercase_cols == True:
             cols = [col.lower() for col in self.data.columns]
             self.data = self.data.rename(dict(zip(self.data.columns, cols)), axis=1)
-            
+        
+        # validate every row with vectorized rules, each rejected row is counted under the first rule it fails
+        valid = np.ones(len(self.data), dtype=bool)
+        reasons = np.full(len(self.data), -1, dtype=np.int8)
+        rules = []
+        
+        def reject(rule, bad):
+            bad = valid & bad
+            reasons[bad] = len(rules)
+            rules.append(rule)
+            valid[bad] = False
+        
         # remove incorrect location data
-        self.data = self.data[(self.data.lat > min_lat)]
+        reject('location', ~(self.data['lat'] > min_lat).to_numpy())
         
-        # standardize shooting data
+        # standardize shooting data, rejecting values other than 0/1 (numbers or text), Y or blank
         if fix_shootings == True:
-            shoot_dict = {0: 0, 1:1, np.nan:0, 'Y':1}
-            self.data['shooting'] = self.data.apply(lambda row: shoot_dict[row['shooting']], axis=1)
+            shooting = self.data['shooting']
+            reject('shooting', ~(shooting.isin([0, 1, '0', '1', 'Y']) | shooting.isna()).to_numpy())
+            self.data['shooting'] = shooting.isin([1, '1', 'Y']).astype(int)
          
         # change all capitalized values to title case    
         for col in title_case_cols:
@@ -106,32 +231,319 @@ class CrimeReport:
         
         # remove any data without offense code group
         if offcodegroup_needed == True:
-            self.data = CrimeReport._assign_offcode_group(self)
+            groups, unknown = CrimeReport._assign_offcode_group(self, valid)
+            reject('offense_code', unknown)
+            self.data['offense_code_group'] = groups
             
         else:
             del_cols.append('offense_code_group')
             
         # drop nan values from "important" columns
-        self.data = self.data.dropna(subset=no_nan_cols)
+        for col in no_nan_cols:
+            reject(f'missing_{col}', self.data[col].isna().to_numpy())
         
         if fix_time == True:
-            # turn str of time to datetime object 
-            self.data['datetime'] = self.data['occurred_on_date'].apply(lambda x: datetime.fromisoformat(x))
-    
+            # turn str of time to datetime object, rejecting dates that do not parse
+            when = pd.to_datetime(self.data['occurred_on_date'], format='ISO8601', errors='coerce')
+            reject('occurred_on_date', when.isna().to_numpy())
+            self.data['datetime'] = when
+            
+            # reject missing or out of range year and month values, which the month labels are built from
+            year = pd.to_numeric(self.data['year'], errors='coerce')
+            month = pd.to_numeric(self.data['month'], errors='coerce')
+            reject('year_month', ~(year.between(1900, 2100) & month.between(1, 12) & (year % 1 == 0) & (month % 1 == 0)).to_numpy())
+            self.data['year'], self.data['month'] = year, month
+            
+        # count rejected rows per source file and rule, then drop them all at once
+        self._quality_report(reasons, rules)
+        self.data = self.data[valid]
+        if len(self._source_codes) == len(valid):
+            self._source_codes = self._source_codes[valid]
+        
+        if fix_time == True:
+            # whole numbers again once the rows with missing values are gone
+            self.data = self.data.astype({'year': np.int64, 'month': np.int64})
+            
             # create time object for month and year only
-            self.data['mon_yr'] = self.data.apply(lambda row: str(datetime(month=row['month'], 
-                                                                         year=row['year'], day=1)), axis=1)
+            month_start = pd.to_datetime(pd.DataFrame({'year': self.data['year'], 'month': self.data['month'], 'day': 1}))
+            self.data['mon_yr'] = month_start.dt.strftime('%Y-%m-%d %H:%M:%S')
+            
             # create time object for day, month, year only
-            self.data['day_mon_yr']= self.data.apply(lambda row: str(datetime(month=row['month'], day=row['datetime'].day,
-                                                                         year=row['year'])), axis=1)
+            self.data['day_mon_yr'] = (month_start + pd.to_timedelta(self.data['datetime'].dt.day - 1, unit='D')).dt.strftime('%Y-%m-%d %H:%M:%S')
 
         # remove unneccesary columns
         self.data = self.data.drop(columns=del_cols)
         
         if fix_streets == True:
-            # remove zip code, city and state from location
-            self.data['street'] = self.data['street'].apply(lambda row: row.split('\n')[0])
+            CrimeReport._normalize_streets(self)
+            
+    def _quality_report(self, reasons, rules):
+        '''
+        Purpose:
+            count the rows rejected by each validation rule per source file in one bincount
             
-            # add intersection col
-            self.data['intersection'] = self.data['street'].apply(lambda row: bool(re.findall('&', row)))
+        Args:
+            reasons (ndarray): index into rules of the rule each row failed, -1 for kept rows
+            rules (list): names of the validation rules in the order they ran
+            
+        Return:
+            None, stores the dataframe of loaded, rejected per rule and kept rows per source in self.quality
+        '''
+        
+        # rows not loaded through load_report count under a single unnamed source
+        if len(self._source_codes) == len(reasons):
+            sources, codes = self.sources, self._source_codes.astype(np.int64)
+        else:
+            sources, codes = ['data'], np.zeros(len(reasons), dtype=np.int64)
+        
+        # kept rows go in the last column
+        flat = codes * (len(rules) + 1) + np.where(reasons < 0, len(rules), reasons)
+        counts = np.bincount(flat, minlength=len(sources) * (len(rules) + 1)).reshape(len(sources), len(rules) + 1)
+        
+        self.quality = pd.DataFrame(counts, index=pd.Index(sources, name='source'), columns=rules + ['kept'])
+        self.quality.insert(0, 'loaded', counts.sum(axis=1))
+    
+    def quality_report(self):
+        '''
+        Purpose:
+            summarize the rows clean_data rejected, per rule and per source file
+            
+        Args:
+            None
+            
+        Return:
+            str table of loaded, rejected and kept rows, with a total row
+        '''
+        
+        # nothing was cleaned yet
+        if self.quality.empty:
+            return "rejected 0 of 0 rows"
+        
+        report = self.quality.copy()
+        report.loc['total'] = report.sum()
+        rejected = report['loaded'].iloc[-1] - report['kept'].iloc[-1]
+        return f"rejected {rejected} of {report['loaded'].iloc[-1]} rows\n{report.to_string()}"
+    
+    def _normalize_streets(self):
+        '''
+        Purpose:
+            canonicalize street names once per unique value, listing the streets of an intersection
+            in sorted order so an intersection has one name whichever street was reported first,
+            and store them as integer street ids with a lookup table in self.streets
+            
+        Args:
+            None
+            
+        Return:
+            None, replaces the street column and adds the street_id and intersection columns
+        '''
+        
+        # canonicalize each distinct raw street value only once
+        codes, uniques = pd.factorize(self.data['street'])
+        components = [tuple(sorted(set(canonical_street(raw)))) for raw in uniques]
+        
+        # per unique value: full canonical name and whether it is an intersection
+        # trailing entry catches missing streets, which factorize codes as -1
+        components.append(())
+        full = np.array([' & '.join(comp) if comp else np.nan for comp in components], dtype=object)
+        cross = np.array([len(comp) > 1 for comp in components])
+        
+        # ids follow name order, so sorting by id sorts by street name
+        ids, names = pd.factorize(full[codes], sort=True)
+        self.streets = pd.Series(names, name='street')
+        self.data['street_id'] = ids.astype(np.int32)
+        
+        # broadcast per unique results back to rows
+        self.data['street'] = full[codes]
+        
+        # add intersection col
+        self.data['intersection'] = cross[codes]
+        
+    def compact(self, max_ratio=0.5):
+        '''
+        Purpose:
+            shrink the cleaned dataframe in place for memory-bounded deployments, storing repeated
+            strings (including the mon_yr and day_mon_yr labels) as categoricals and downcasting numbers
+            
+        Args:
+            max_ratio (float): largest share of distinct values for a string column to become categorical
+            
+        Return:
+            None, changes column dtypes
+        '''
+        
+        for col in self.data.columns:
+            values = self.data[col]
+            if values.dtype == object and values.nunique() <= max_ratio * len(values):
+                self.data[col] = values.astype('category')
+            elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                self.data[col] = pd.to_numeric(values, downcast='integer')
+        self.compacted = True
+        
+    def _mask(self, year=None, offenses=None, streets=None):
+        '''
+        Purpose:
+            boolean mask of the rows matching the selected year, offense code groups and streets
+            
+        Args:
+            year (int): year to keep, None keeps all years
+            offenses (list): offense code groups to keep, None keeps all groups
+            streets (list): streets to keep, None keeps all streets
+            
+        Return:
+            numpy boolean array
+        '''
+        
+        mask = np.ones(len(self.data), dtype=bool)
+        if year is not None:
+            mask &= self.data['year'].to_numpy() == year
+        if offenses is not None:
+            mask &= self.data['offense_code_group'].isin(offenses).to_numpy()
+        if streets is not None and 'street_id' in self.data:
+            ids = self.streets.index[self.streets.isin(streets)]
+            mask &= np.isin(self.data['street_id'].to_numpy(), ids)
+        elif streets is not None:
+            mask &= self.data['street'].isin(streets).to_numpy()
+        return mask
+    
+    def positions(self, year=None, offenses=None, streets=None):
+        '''
+        Purpose:
+            row positions of the crime reports matching the selected filters, so callers can take
+            only the rows (and columns) they need instead of copying a filtered dataframe
+            
+        Args:
+            year (int): year to keep, None keeps all years
+            offenses (list): offense code groups to keep, None keeps all groups
+            streets (list): streets to keep, None keeps all streets
+            
+        Return:
+            numpy array of row positions in self.data
+        '''
+        
+        return np.flatnonzero(self._mask(year, offenses, streets))
+    
+    def take(self, col, positions):
+        '''
+        Purpose:
+            values of one column at the given row positions, gathered before converting to numpy
+            so categorical columns are never expanded for rows that are not selected
+            
+        Args:
+            col (str): column name
+            positions (ndarray): row positions
+            
+        Return:
+            numpy array of the column's values at positions
+        '''
+        
+        return np.asarray(self.data[col].array.take(positions))
+    
+    def incidents(self, year, offenses=None, cols=None, positions=None):
+        '''
+        Purpose:
+            select the crime reports of a year for the selected offense code groups
+            
+        Args:
+            year (int): year selected
+            offenses (list): offense code groups to keep, None keeps all groups
+            cols (list): columns to return, None returns all columns
+            positions (ndarray): row positions of the year and offenses if already computed
+            
+        Return:
+            dataframe of the matching crime reports
+        '''
+        
+        if positions is None:
+            positions = self.positions(year, offenses)
+        col_positions = slice(None) if cols is None else [self.data.columns.get_loc(col) for col in cols]
+        return self.data.iloc[positions, col_positions]
+    
+    def offense_groups(self, year, positions=None):
+        '''
+        Purpose:
+            list the offense code groups reported in a year
+            
+        Args:
+            year (int): year selected
+            positions (ndarray): row positions of the year if already computed
+            
+        Return:
+            list of offense code groups
+        '''
+        
+        if positions is None:
+            positions = self.positions(year)
+        return pd.unique(self.take('offense_code_group', positions)).tolist()
+    
+    @cached_result
+    def year_offense_counts(self):
+        '''
+        Purpose:
+            count crimes for every year and offense code group
+            
+        Args:
+            None
+            
+        Return:
+            dataframe indexed by year and offense_code_group, counting the non-null values of every column
+        '''
+        
+        return self.data.groupby(['year', 'offense_code_group'], observed=True).count()
+    
+    @cached_result
+    def street_offense_counts(self, year, streets=None, offenses=None, min_count=0):
+        '''
+        Purpose:
+            count crimes for every street and offense code group pair in a year
+            
+        Args:
+            year (int): year selected
+            streets (list): streets to keep, None keeps all streets
+            offenses (list): offense code groups to keep, None keeps all groups
+            min_count (int): minimum number of crimes for a pair to be kept
+            
+        Return:
+            dataframe of street, offense_code_group and count sorted by count descending
+        '''
+        
+        # group on integer street ids where clean_data assigned them, names are looked up per group
+        street = 'street_id' if 'street_id' in self.data else 'street'
+        crime = self.data.loc[self._mask(year, offenses, streets), [street, 'offense_code_group']]
+        counts = crime.groupby([street, 'offense_code_group'], observed=True).size().reset_index(name='count')
+        if street == 'street_id':
+            counts = counts[counts['street_id'] >= 0]
+            counts.insert(0, 'street', self.streets.to_numpy()[counts.pop('street_id').to_numpy()])
+        counts = counts.sort_values('count', ascending=False)
+        counts = counts[counts['count'] >= min_count]
+        
+        # plain labels, compacted categorical columns carry every category of the dataset
+        return counts.astype({'street': object, 'offense_code_group': object})
+    
+    @cached_result
+    def histograms(self, year, offenses=None, positions=None):
+        '''
+        Purpose:
+            count crimes by month, day of week and hour in a year
+            
+        Args:
+            year (int): year selected
+            offenses (list): offense code groups to keep, None keeps all groups
+            positions (ndarray): row positions of the year and offenses if already computed
+            
+        Return:
+            dict of month, day_of_week and hour series of counts, only keeping values that occur
+        '''
+        
+        if positions is None:
+            positions = self.positions(year, offenses)
+        
+        # count with bincount rather than a groupby of every column
+        month = np.bincount(self.take('month', positions), minlength=13)
+        hour = np.bincount(self.take('hour', positions), minlength=24)
+        day = pd.Categorical(self.take('day_of_week', positions), categories=DAYS).codes
+        day = np.bincount(day[day >= 0], minlength=len(DAYS))
         
+        return {'month': pd.Series(month, name='count')[month > 0],
+                'day_of_week': pd.Series(day, index=DAYS, name='count')[day > 0],
+                'hour': pd.Series(hour, name='count')[hour > 0]}
@@ -0,0 +1,210 @@
+"""
+@file: crime_sql.py
+
+CrimeReport backed by an embedded, file-local SQL database. Uses DuckDB when it is
+installed and falls back to the sqlite3 module otherwise
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from crime_dash_library import CrimeReport, DAYS
+from result_cache import cached_result
+
+# duckdb is optional, sqlite3 ships with python
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# indexed columns, year first since every dashboard query filters on it
+SQL_INDEXES = {'idx_year_offense': ['year', 'offense_code_group'],
+               'idx_district': ['district'],
+               'idx_street': ['street']}
+
+
+def _placeholders(values):
+    ''' SQL placeholders for an IN list of values '''
+    return ', '.join('?' * len(values))
+
+
+class SQLCrimeReport(CrimeReport):
+
+    # rows are selected by the database, so precomputed row positions are ignored
+    positional = False
+
+    def __init__(self, engine=None):
+        """Constructor"""
+
+        super().__init__()
+
+        # duckdb when installed unless sqlite is asked for
+        if engine is None:
+            engine = 'duckdb' if duckdb is not None else 'sqlite'
+        self.engine = engine
+
+        # connection to the embedded database, opened by build_database
+        # callbacks run on several threads and neither connection type is safe to share unlocked
+        self.con = None
+        self._lock = threading.Lock()
+
+    def _connect(self, path, read_only=False):
+        if self.engine == 'duckdb':
+            return duckdb.connect(path, read_only=read_only)
+        if read_only:
+            return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        return sqlite3.connect(path, check_same_thread=False)
+
+    def open_database(self, path='crime.db'):
+        '''
+        Purpose:
+            open an already built database file read-only, so several dashboard processes can share it
+
+        Args:
+            path (str): database file written by build_database
+
+        Return:
+            None, opens self.con
+        '''
+
+        if self.con is not None:
+            self.con.close()
+        self.con = self._connect(path, read_only=True)
+
+    def _query(self, sql, params=()):
+        '''
+        Purpose:
+            run a parameterized query on the embedded database
+
+        Args:
+            sql (str): query with ? placeholders
+            params (list): values bound to the placeholders
+
+        Return:
+            dataframe of the query results
+        '''
+
+        with self._lock:
+            if self.engine == 'duckdb':
+                return self.con.execute(sql, list(params)).df()
+            return pd.read_sql_query(sql, self.con, params=list(params))
+
+    def build_database(self, path='crime.db'):
+        '''
+        Purpose:
+            load the cleaned dataframe into an indexed table, reusing the database file
+            if it was already built from the same data
+
+        Args:
+            path (str): database file, ":memory:" keeps it in memory
+
+        Return:
+            None, opens self.con
+        '''
+
+        fingerprint = self.fingerprint()
+
+        # database already holds this dataset, with every column incidents can return, checked
+        # read-only so processes sharing a built file never wait on the write lock
+        if path != ':memory:' and os.path.exists(path):
+            try:
+                self.open_database(path)
+                built = self._query('SELECT fingerprint FROM meta')['fingerprint'].tolist()
+                cols = self._query('SELECT * FROM crimes LIMIT 0').columns.tolist()
+                if built == [fingerprint] and cols == self.data.columns.tolist():
+                    return
+            except Exception:
+                pass
+
+        # duckdb refuses a second connection to a file another connection of this process holds
+        if self.con is not None:
+            self.con.close()
+        self.con = self._connect(path)
+
+        data = self.data
+        if self.engine == 'duckdb':
+            self.con.register('cleaned', data)
+            self.con.execute('CREATE OR REPLACE TABLE crimes AS SELECT * FROM cleaned')
+            self.con.unregister('cleaned')
+        else:
+            data.to_sql('crimes', self.con, index=False, if_exists='replace', chunksize=100000)
+
+        for name, cols in SQL_INDEXES.items():
+            self.con.execute(f'DROP INDEX IF EXISTS {name}')
+            self.con.execute(f'CREATE INDEX {name} ON crimes ({", ".join(cols)})')
+
+        # remember which dataset the file was built from
+        self.con.execute('DROP TABLE IF EXISTS meta')
+        self.con.execute('CREATE TABLE meta (fingerprint VARCHAR)')
+        self.con.execute('INSERT INTO meta VALUES (?)', [fingerprint])
+        if self.engine == 'sqlite':
+            self.con.commit()
+
+        # reopen read-only so worker processes can open the file too
+        if path != ':memory:':
+            self.open_database(path)
+
+    def _where(self, year=None, offenses=None, streets=None):
+        '''
+        Purpose:
+            build the WHERE clause and parameters for the selected filters
+
+        Args:
+            year (int): year to keep, None keeps all years
+            offenses (list): offense code groups to keep, None keeps all groups
+            streets (list): streets to keep, None keeps all streets
+
+        Return:
+            tuple of WHERE clause and list of parameters
+        '''
+
+        clauses, params = [], []
+        if year is not None:
+            clauses.append('year = ?')
+            params.append(int(year))
+        if offenses is not None:
+            clauses.append(f'offense_code_group IN ({_placeholders(offenses)})')
+            params.extend(offenses)
+        if streets is not None:
+            clauses.append(f'street IN ({_placeholders(streets)})')
+            params.extend(streets)
+
+        # an empty IN list is invalid SQL, and matches nothing anyway
+        if (offenses is not None and len(offenses) == 0) or (streets is not None and len(streets) == 0):
+            return 'WHERE 1 = 0', []
+
+        return ('WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def incidents(self, year, offenses=None, cols=None, positions=None):
+        where, params = self._where(year, offenses)
+        return self._query(f'SELECT {"*" if cols is None else ", ".join(cols)} FROM crimes {where}', params)
+
+    def offense_groups(self, year, positions=None):
+        where, params = self._where(year)
+        return self._query(f'SELECT DISTINCT offense_code_group FROM crimes {where}', params)['offense_code_group'].tolist()
+
+    @cached_result
+    def street_offense_counts(self, year, streets=None, offenses=None, min_count=0):
+        where, params = self._where(year, offenses, streets)
+        sql = f'''SELECT street, offense_code_group, COUNT(*) AS count FROM crimes {where}
+                  GROUP BY street, offense_code_group HAVING COUNT(*) >= ?
+                  ORDER BY count DESC'''
+        return self._query(sql, params + [int(min_count)])
+
+    @cached_result
+    def histograms(self, year, offenses=None, positions=None):
+        where, params = self._where(year, offenses)
+        counts = {}
+        for col in ['month', 'day_of_week', 'hour']:
+            sql = f'SELECT {col}, COUNT(*) AS count FROM crimes {where} GROUP BY {col} ORDER BY {col}'
+            counts[col] = self._query(sql, params).set_index(col)['count']
+
+        # days in week order rather than alphabetical
+        counts['day_of_week'] = counts['day_of_week'].reindex([day for day in DAYS if day in counts['day_of_week'].index])
+        return counts
@@ -6,52 +6,235 @@
 """
 
 # import necessary libraries
+# plotly, pandas and the figure modules are imported once data warms up so the server starts quickly
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import dash
-import plotly.express as px
-import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output
-import sankey as ms
-from plotly.subplots import make_subplots
-from crime_dash_library import CrimeReport
+from dash import Dash, html, dcc, Input, Output, State
+from dash.exceptions import PreventUpdate
+from urllib.parse import urlencode
+import export
+from precompute import FigureStore
 
 
+# print how long each startup phase takes when run with --profile-startup
+PROFILE_STARTUP = '--profile-startup' in sys.argv
 
+# query the data through an embedded SQL database when run with --backend-sql
+BACKEND_SQL = '--backend-sql' in sys.argv
+DB_PATH = 'figure_cache/crime.db'
 
-def main():
+# cap memory use for multi-user deployments when run with --memory-budget=<MB>
+MEMORY_BUDGET = next((float(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--memory-budget=')), None)
+
+# cache aggregates on disk for every dashboard process on the host when run with --result-cache=<MB>
+RESULT_CACHE = next((float(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--result-cache=')), None)
+RESULT_CACHE_DIR = 'figure_cache/results'
+
+
+@contextmanager
+def _timed(label):
+    ''' Time a startup phase and print it when profiling '''
+    start = time.perf_counter()
+    yield
+    if PROFILE_STARTUP:
+        print(f"[startup] {label}: {time.perf_counter() - start:.2f}s", flush=True)
+
+
+def warm_up(state, ready, imported, budget=None):
+    '''
+    Purpose:
+        load and clean all crime reports, then build everything the callbacks need,
+        in the background so the server accepts connections right away
+        
+    Args:
+        state (dict): shared dict the warmed up objects are stored in
+        ready (Event): set once state is filled (or warm up failed)
+        imported (Event): set once pandas and plotly are imported
+        budget (MemoryBudget): memory budget in memory-bounded mode, None otherwise
+        
+    Return:
+        None, fills state
+    '''
     
-    # intialize class
-    cr = CrimeReport()
+    try:
+        with _timed('import pandas/plotly'):
+            import plotly.express as px
+            from crime_dash_library import CrimeReport
+            from precompute import build_artifacts, prerender_animations
+            from jobs import FigureJobQueue
+            from result_cache import MB, ResultCache
+        imported.set()
+        
+        # intialize class
+        if BACKEND_SQL:
+            from crime_sql import SQLCrimeReport
+            cr = SQLCrimeReport()
+        else:
+            cr = CrimeReport()
+        
+        # load all csvs into class
+        with _timed('load csv files'):
+            for num in range(15,23):
+                cr.load_report(f'crime_20{num}.csv')
+            
+        # clean dataframe
+        with _timed('clean data'):
+            cr.clean_data(title_case_cols=['offense_code_group', 'street'],
+                      no_nan_cols=['street', 'offense_code_group', 'district'], 
+                      del_cols=['reporting_area', 'occurred_on_date', 'ucr_part', 'location'])
+        
+        # report rows rejected by validation so upstream feed problems show up in the logs
+        print(cr.quality_report(), flush=True)
+        
+        # store repeated strings as categoricals and downcast numbers when memory is capped
+        if budget is not None:
+            with _timed('compact data'):
+                cr.compact()
+        
+        # serve aggregates other processes already computed for this dataset
+        if RESULT_CACHE:
+            with _timed('fingerprint data'):
+                cr.use_results(ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE * MB)))
+        
+        # load cleaned data into the indexed database
+        if BACKEND_SQL:
+            os.makedirs('figure_cache', exist_ok=True)
+            with _timed('build database'):
+                cr.build_database(DB_PATH)
+        
+        # load mapbox key for visualizations 
+        act = 'pk.eyJ1IjoiYW5hbmRhZnJhbmNpcyIsImEiOiJjbDJldDk4NW0wM3lkM2tubHhkMjhhN254In0.MCN_0yxCGqGSNI6n121X0w'
+        px.set_mapbox_access_token(act)
+        
+        # group dataframe by year and offense
+        crime_year_offense = cr.year_offense_counts()
+        
+        # pre-render figures that only depend on the dataset
+        with _timed('pre-render figures'):
+            build_artifacts(cr, 'figure_cache', crime_year_offense)
+        
+        # build figure templates before the first callback needs them
+        with _timed('build figure templates'):
+            import figure_templates as ft
+            ft.map_chart(cr.data.iloc[:0])
+            ft.line_chart(cr.histograms(None, []), "")
+        
+        # count every year once for year over year comparisons
+        with _timed('count years'):
+            from comparison import YearCounts
+            year_counts = YearCounts(cr.data)
+        
+        # group district, street and offense description counts once for the drill-down
+        with _timed('build drill-down hierarchy'):
+            from hierarchy import CrimeHierarchy
+            hierarchy = CrimeHierarchy(cr.data, budget.cache('hierarchy', 0.25) if budget else None)
+        
+        # bin incident locations once for the hotspot layer
+        with _timed('build hotspot grid'):
+            from hotspots import HotspotEngine
+            hotspots = HotspotEngine(cr.data, cache=budget.cache('hotspots', 0.25) if budget else None)
+        
+        # build slow figures in background worker processes, each holds a copy of the data
+        # so a capped deployment runs a single worker
+        with _timed('start figure workers'):
+            job_queue = FigureJobQueue(cr.data, 'figure_cache/data.pkl', act, DB_PATH if BACKEND_SQL else None,
+                                       getattr(cr, 'engine', None), max_workers=1 if budget else None,
+                                       results=(cr.results, cr.results_fingerprint), streets=cr.streets)
+        
+        # obtain list of offenses, street names (for dropdown elements)
+        # order lists in alphabetical order
+        # add all option to lists
+        offense = cr.data['offense_code_group'].unique().tolist()
+        offense = sorted(offense)
+        offense.insert(0, "All Offense Code Groups")
+        street = cr.streets.tolist()
+        street.insert(0, "All Streets")
+        
+        state.update(cr=cr, crime_year_offense=crime_year_offense, job_queue=job_queue, hotspots=hotspots,
+                     year_counts=year_counts, hierarchy=hierarchy,
+                     offense=offense, street=street)
+        
+        # render each offense code group's animations in the background, the most common single selections
+        threading.Thread(target=prerender_animations, args=(job_queue, 'figure_cache', offense[1:]), daemon=True).start()
+        
+    except Exception as err:
+        state['error'] = f"Could not load crime data: {err}"
+        raise
     
-    # load all csvs into class
-    for num in range(15,23):
-        cr.load_report(f'crime_20{num}.csv')
-        
-    # clean dataframe
-    cr.clean_data(title_case_cols=['offense_code_group', 'street'],
-              no_nan_cols=['street', 'offense_code_group', 'district'], 
-              del_cols=['reporting_area', 'occurred_on_date', 'ucr_part', 'location'])
+    finally:
+        imported.set()
+        ready.set()
+
+
+def main():
     
-    # load mapbox key for visualizations 
-    act = 'pk.eyJ1IjoiYW5hbmRhZnJhbmNpcyIsImEiOiJjbDJldDk4NW0wM3lkM2tubHhkMjhhN254In0.MCN_0yxCGqGSNI6n121X0w'
-    px.set_mapbox_access_token(act)
+    start = time.perf_counter()
     
-    # group dataframe by year and offense
-    crime_year_offense = cr.data.groupby(['year', 'offense_code_group']).count()
+    # objects built by the warm up thread
+    state = {}
+    ready = threading.Event()
+    imported = threading.Event()
     
-    # obtain list of offenses, street names (for dropdown elements)
-    # order lists in alphabetical order
-    # add all option to lists
-    offense = cr.data['offense_code_group'].unique().tolist()
-    offense = sorted(offense)
-    offense.insert(0, "All Offense Code Groups")
-    street = cr.data['street'].unique().tolist()
-    street = sorted(street)
-    street.insert(0, "All Streets")
+    # bound request intermediates and cached aggregates, spilling to disk, when memory is capped
+    budget = None
+    if MEMORY_BUDGET:
+        from memory import MemoryBudget
+        budget = MemoryBudget(MEMORY_BUDGET, 'figure_cache/spill')
+    figure_store = FigureStore('figure_cache', budget.cache('figures', 0.5) if budget else None)
     
+    # with the debug reloader only the serving child process needs the data
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=warm_up, args=(state, ready, imported, budget), daemon=True).start()
 
     app = Dash(__name__)
     
-    app = Dash(__name__)
+    # plotly serializes the layout and callback responses with pandas once it is in sys.modules,
+    # so hold them while the warm up thread is still importing it. Static assets and the warm up
+    # poll, which answers without a body until the data is ready, are served right away
+    @app.server.before_request
+    def wait_for_imports():
+        from flask import request
+        if imported.is_set():
+            return
+        if request.path.endswith('/_dash-layout'):
+            imported.wait()
+        elif request.path.endswith('/_dash-update-component'):
+            callback = request.get_json(silent=True) or {}
+            if 'loading-status.children' not in callback.get('output', ''):
+                imported.wait()
+    
+    # serve pre-rendered figures with cache headers
+    figure_store.register_routes(app.server)
+    
+    # stream the filtered crime reports as CSV or Parquet downloads
+    export.register_routes(app.server, lambda: state.get('cr') if ready.is_set() else None)
+    
+    # report the peak RSS of each callback in memory-bounded mode
+    if budget is not None:
+        budget.register_routes(app.server)
+    
+    # log_when picks the calls worth printing from their result, e.g. skipping idle polls
+    def measured(func=None, log_when=None):
+        if func is None:
+            return functools.partial(measured, log_when=log_when)
+        if budget is None:
+            return func
+        
+        @functools.wraps(func)
+        def wrapper(*args):
+            with budget.track(func.__name__) as record:
+                result = func(*args)
+                record['log'] = log_when is None or log_when(result)
+            return result
+        return wrapper
     
     app.layout = html.Div(
         children=[
@@ -64,6 +247,10 @@ def main():
                 children="Analyze the types of crimes and the number of crimes committed in Boston from August 2015 to April 2022 on a yearly, monthly, daily, and hourly basis and at a street level",
                 style = {"color": "black", "textAlign": "center", "margin": "4px auto", 'maxWidth': '384px'}
             ),
+            # show loading state until the data has warmed up
+            html.Div(id="loading-status", children="Loading crime data...", style = {"textAlign": "center"}),
+            dcc.Store(id="data-ready", data=False),
+            dcc.Interval(id="warmup-poll", interval=500),
             # add year slider
             html.Div(children="Year", className="menu-title"),
             dcc.Slider(
@@ -87,7 +274,7 @@ def main():
             html.Div(children="Offense Code Group", className="menu-title"),
             dcc.Dropdown(
                 id="offense-filter",
-                options=offense,
+                options=[],
                 value="All Offense Code Groups",
                 multi = True,
                 clearable=False,
@@ -95,6 +282,14 @@ def main():
                 ),
             # add break
             html.Br(),
+            # add download links for the selected crime reports, parquet only when pyarrow is installed
+            html.Div(children=[
+                html.A("Download CSV", id="export-csv", href="/export.csv"),
+                html.Span(" | ", hidden=not export.HAS_PYARROW),
+                html.A("Download Parquet", id="export-parquet", href="/export.parquet", hidden=not export.HAS_PYARROW),
+                ]),
+            # add hotspot layer toggle
+            dcc.Checklist(id="hotspot-toggle", options=["Show hotspots"], value=[]),
             # add map scatter plot
             html.Div(
                 children=dcc.Graph(
@@ -139,13 +334,50 @@ def main():
                 ),
                 className="card",
             ),
+            # add year over year comparison
+            html.Div(children="Compare Years", className="menu-title"),
+            html.Div(
+                children=[
+                    dcc.Dropdown(id="compare-year-a", options=list(range(2015, 2023)), value=2021, clearable=False,
+                                 style = dict(width='120px')),
+                    dcc.Dropdown(id="compare-year-b", options=list(range(2015, 2023)), value=2022, clearable=False,
+                                 style = dict(width='120px')),
+                ],
+                style = {"display": "flex", "gap": "8px"},
+            ),
+            html.Div(
+                children=dcc.Graph(
+                    id="comparison-chart", config={"displayModeBar": False}
+                ),
+                className="card",
+            ),
+            # add drill-down from district to street to offense description
+            html.Div(children="Drill Down", className="menu-title"),
+            html.Div(
+                children=[
+                    dcc.Dropdown(id="drill-district", options=[], placeholder="All Districts",
+                                 style = dict(width='160px')),
+                    dcc.Dropdown(id="drill-street", options=[], placeholder="All Streets",
+                                 style = dict(width='320px')),
+                    dcc.RadioItems(id="drill-kind", options=[{"label": "Treemap", "value": "treemap"},
+                                                             {"label": "Sunburst", "value": "sunburst"}],
+                                   value="treemap", inline=True),
+                ],
+                style = {"display": "flex", "gap": "8px", "alignItems": "center"},
+            ),
+            html.Div(
+                children=dcc.Graph(
+                    id="drill-chart", config={"displayModeBar": False}
+                ),
+                className="card",
+            ),
            # add break
             html.Br(),
             # add street multi-value dropdown
             html.Div(children="Street", className="menu-title"),
             dcc.Dropdown(
                 id="street-filter",
-                options=street,
+                options=[],
                 value="All Streets",
                 multi = True,
                 clearable=False,
@@ -155,7 +387,7 @@ def main():
             html.Div(children="Crime", className="menu-title"),
             dcc.Dropdown(
                 id="crime-filter",
-                options=offense,
+                options=[],
                 value="All Offense Code Groups",
                 multi = True,
                 clearable=False,
@@ -171,261 +403,269 @@ def main():
             html.Div(children="Minimum Crimes", className="menu-title"),
             dcc.Slider(0, 100, 5, value=15, id='count-slider'
             ),
+            # progress of figures still rendering in the background
+            html.Div(id="job-progress", style = {"textAlign": "center"}),
+            dcc.Store(id="figure-jobs"),
+            dcc.Store(id="delivered-jobs", data=[]),
+            dcc.Interval(id="job-poll", interval=500, disabled=True),
         ],
     )
     
     @app.callback(
-        Output("animation1", "figure"),
-        Output("animation2", "figure"),
-        Output("animation3", "figure"),
+        Output("offense-filter", "options"),
+        Output("street-filter", "options"),
+        Output("crime-filter", "options"),
+        Output("data-ready", "data"),
+        Output("loading-status", "children"),
+        Output("warmup-poll", "disabled"),
+        Input("warmup-poll", "n_intervals")
+        )
+    def check_warm_up(n_intervals):
+        
+        # keep showing the loading state until the warm up thread finishes
+        if not ready.is_set():
+            raise PreventUpdate
+        
+        if 'error' in state:
+            return [], [], [], False, state['error'], True
+        
+        if PROFILE_STARTUP:
+            print(f"[startup] data ready after {time.perf_counter() - start:.2f}s", flush=True)
+        
+        return state['offense'], state['street'], state['offense'], True, "", True
+    
+    @app.callback(
         Output("graph-chart", "figure"),
         Output("bar-chart", "figure"),
         Output("line-chart", "figure"),
-        Output("street_chart", "figure"),
+        Output("figure-jobs", "data"),
+        Output("job-poll", "disabled"),
         Input("year-slider", "value"),
         Input("offense-filter", "value"),
         Input("street-filter", "value"),
         Input("crime-filter", "value"),
-        Input("count-slider", "value")
+        Input("count-slider", "value"),
+        Input("hotspot-toggle", "value"),
+        Input("data-ready", "data")
         )
-    def update_charts(year, offense, street, crime, count):
+    @measured
+    def update_charts(year, offense, street, crime, count, show_hotspots, data_ready):
+        
+        if not data_ready:
+            raise PreventUpdate
+        
+        import figure_templates as ft
+        from figures import make_bar_chart
+        from filters import FilterState, RowSelection
+        from precompute import bar_name, animation_name
+        from jobs import animations_job, sankey_job
+        cr, crime_year_offense, job_queue = state['cr'], state['crime_year_offense'], state['job_queue']
         
         # Initial Data Clean/Data Prep
-        # convert year to integer
-        # filter DataFrame to year selected
-        year = int(year)
-        year_bool = cr.data['year'] == year
-        crime_ybool = cr.data.loc[year_bool,:]
+        # normalize the dropdown values once and share each subset's row positions between figures
+        filters = FilterState(year, offense, street, crime)
+        rows = RowSelection(cr, budget.max_rows(ft.MAP_POINT_BYTES) if budget else None)
+        year = filters.year
         
         # convert offense code groups to list for all filter in map plot
-        offenses = crime_ybool['offense_code_group'].unique().tolist()
+        offenses = rows.offense_groups(year)
        
         # filter grouped year/offense DataFrame by year selected
         crime_obool = crime_year_offense.loc[year]
         
+        # return non-updated dashboard when nothing is selected in street to crime sankey filters
+        if len(filters.street) == 0 or len(filters.crime) == 0:
+            return dash.no_update
         
+        # queue street to crime sankey diagram in the background
+        args = [year, filters.streets, filters.crimes, count]
+        sankey = {'key': json.dumps(['sankey'] + args), 'args': args}
+        job_queue.submit(sankey['key'], sankey_job, *args)
         
-        # Street to Crime Sankey Diagram
+        # Map Scatter Plot/Bar Chart/Line Chart Subplots
         # return non-updated dashboard when nothing is selected in filter
-        if len(street) == 0:
+        if len(filters.offense) == 0:
             return dash.no_update
         
-        elif isinstance(street, str):
-            # keep all streets in DataFrame if all filter is selected
-            if street == "All Streets":
-                crime_sankey = crime_ybool
-            # keep only relevant street in DataFrame if single street is selected
-            else:
-                crime_sankey = crime_ybool[crime_ybool["street"] == street]
-        
-        elif isinstance(street, list):
-            # keep all streets in DataFrame if all filter is selected
-            if "All Streets" in street:
-                crime_sankey = crime_ybool
-            # keep only relevant streets in DataFrame if multiple streets are selected
-            else:
-                crime_sankey = crime_ybool[crime_ybool["street"].isin(street)]
+        # keep all offense code groups when all filter is selected, otherwise the selected ones
+        map_offenses = filters.offenses
+        anim_offenses = offenses if map_offenses is None else map_offenses
+        offense_str = filters.offense_str
         
-        # return non-updated dashboard when nothing is selected in filter
-        if len(crime) == 0:
-            return dash.no_update
+        # fill map scatter plot template with only the columns it needs of the selected incidents
+        graph_chart = ft.map_chart(rows.columns(ft.MAP_COLS, year, map_offenses))
         
-        elif isinstance(crime, str):
-            # keep all offense code groups in DataFrame if all filter is selected
-            if crime == "All Offense Code Groups":
-                crime_sankey = crime_sankey
-            # keep only relevant offense code group in DataFrame if single offense code group is selected
-            else:
-                crime_sankey = crime_sankey[crime_sankey["offense_code_group"] == crime]
-        
-        elif isinstance(crime, list):
-            # keep all offense code groups in DataFrame if all filter is selected
-            if "All Offense Code Groups" in crime:
-                crime_sankey = crime_sankey
-             # keep only relevant offense code groups in DataFrame if multiple offense code groups are selected
-            else:
-                crime_sankey = crime_sankey[crime_sankey["offense_code_group"].isin(crime)]
-
+        # overlay cached hotspots of the selected offense code groups for the year
+        if show_hotspots:
+            graph_chart = ft.add_hotspots(graph_chart, state['hotspots'].year_hotspots(year, map_offenses))
         
-        # group DataFrame by street and offense code group
-        # sort values in descending order
-        # filter DataFrame by count
-        # create Sankey diagram
-        # source used: https://github.ccs.neu.edu/rachlin/ds3500_sp22
-        crime_sankey = crime_sankey.groupby(['street', 'offense_code_group']).size().reset_index(name='count')
-        crime_sankey = crime_sankey.sort_values('count', ascending=False)
-        crime_sankey = crime_sankey[crime_sankey["count"] >= count]
-        street_chart = ms.make_sankey(crime_sankey, 'street', 'offense_code_group', 'count')
+        # use pre-rendered bar chart of offense code groups and number of incidents for selected year
+        bar_chart = figure_store.get(bar_name(year))
+        if bar_chart is None:
+            bar_chart = make_bar_chart(crime_obool, year)
         
+        # fill month, day, and hour subplots template with number of incidents
+        line_chart = ft.line_chart(rows.histograms(year, map_offenses), f"Number of Incidents for {offense_str} by Month, Day, and Hour in {year}")
         
+        # use pre-rendered animations for the offense code groups shown on the map
+        # otherwise queue them with the sankey diagram in the background, storing them for later requests
+        jobs = {'request': uuid.uuid4().hex}
+        name = animation_name(anim_offenses, offense_str)
+        if figure_store.exists(name):
+            jobs['animations'] = {'artifact': name}
+        else:
+            args = [sorted(anim_offenses), offense_str, figure_store.out_dir]
+            jobs['animations'] = {'key': json.dumps(['animations'] + args), 'args': args}
+            job_queue.submit(jobs['animations']['key'], animations_job, *args)
+        jobs['sankey'] = sankey
         
-        # Map Scatter Plot/Bar Chart/Line Chart Subplots
-        # return non-updated dashboard when nothing is selected in filter
-        if len(offense) == 0:
-            return dash.no_update
+        return graph_chart, bar_chart, line_chart, jobs, False
+    
+    @app.callback(
+        Output("export-csv", "href"),
+        Output("export-parquet", "href"),
+        Input("year-slider", "value"),
+        Input("offense-filter", "value"),
+        Input("street-filter", "value")
+        )
+    def update_export_links(year, offense, street):
         
-        elif isinstance(offense, str):
-            # plot all offenses when all filter is selected
-            # keep all offense code groups in DataFrame when all filter is selected
-            if offense == "All Offense Code Groups":
-                graph_chart = px.scatter_mapbox(crime_ybool[crime_ybool["offense_code_group"].isin(offenses)], lat="lat", lon="long", 
-                                                hover_name="incident_number", hover_data=["year", "offense_code_group", "offense_description", 
-                                                "district", "street", "datetime"],
-                                                color_discrete_sequence=["fuchsia"], zoom=10, height=600)
-                crime = crime_ybool
-            
-            # plot selected single offense
-            # keep selected single offense code group in DataFrame
-            else:
-                graph_chart = px.scatter_mapbox(crime_ybool[crime_ybool["offense_code_group"]==offense], lat="lat", lon="long", 
-                                                hover_name="incident_number", hover_data=["year", "offense_code_group", "offense_description", 
-                                                "district", "street", "datetime"],
-                                                color_discrete_sequence=["fuchsia"], zoom=10, height=600)
-                crime = crime_ybool[crime_ybool["offense_code_group"] == offense]
-            
-            # make string of offense
-            offense_str = offense
-            
-        elif isinstance(offense, list):
-            # plot all offenses when all filter is selected
-            # keep all offense code groups in DataFrame when all filter is selected
-            if "All Offense Code Groups" in offense:
-                graph_chart = px.scatter_mapbox(crime_ybool[crime_ybool["offense_code_group"].isin(offenses)], lat="lat", lon="long", 
-                                                hover_name="incident_number", hover_data=["year", "offense_code_group", "offense_description", 
-                                                "district", "street", "datetime"],
-                                                color_discrete_sequence=["fuchsia"], zoom=10, height=600)
-                crime = crime_ybool
-            
-            # plot selected multiple offenses
-            # keep selected multiple offense code groups in DataFrame
-            else:
-                graph_chart = px.scatter_mapbox(crime_ybool[crime_ybool["offense_code_group"].isin(offense)], lat="lat", lon="long", 
-                                                hover_name="incident_number", hover_data=["year", "offense_code_group", "offense_description", 
-                                                "district", "street", "datetime"],
-                                                color_discrete_sequence=["fuchsia"], zoom=10, height=600)
-                crime = crime_ybool[crime_ybool["offense_code_group"].isin(offense)]
-            
-            # make string of offenses
-            offense_str = ""
-            for o in offense[:-1]:
-                offense_str += f"{o}, "
-            offense_str += offense[-1]
-            
-        # update map plot layout style and margins
-        graph_chart.update_layout(mapbox_style="open-street-map")
-        graph_chart.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-        
-        # create grouped DataFrames by month, hour, and day
-        crime_month = crime.groupby("month").count()
-        cats = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-        crime_day = crime.groupby(["day_of_week"]).count().reindex(cats) 
-        crime_hour = crime.groupby("hour").count()
-        
-        # plot bar chart of offense code groups and number of incidents for selected year
-        # add title, x-axis label, y-axis label
-        bar_chart = px.bar(crime_obool, x=crime_obool.index, y=crime_obool["incident_number"])
-        bar_chart.update_layout(height = 600, title_text=f"Number of Incidents for Each Offense Code Group in {year}", xaxis={'categoryorder':'total descending'})
-        bar_chart.update_xaxes(title_text="Offense Code Group")
-        bar_chart.update_yaxes(title_text='Number of Incidents')
-        
-        # produce 3 subplots for month, day, and hour DataFrame data
-        # add subtitles
-        line_chart = make_subplots(rows=1, cols=3, subplot_titles=("Number of Incidents by Month", "Number of Incidents by Day", "Number of Incidents by Hour"))
-        
-        # plot month with number of incidents 
-        line_chart.add_trace(
-            go.Scatter(x=crime_month.index, y=crime_month['incident_number']),
-            row=1, col=1
+        from filters import FilterState
+        
+        # pass the same filter state as the charts to the export routes,
+        # an empty selection is sent as an empty value since urlencode drops empty lists
+        filters = FilterState(year, offense, street)
+        query = urlencode({'year': filters.year, 'offense': filters.offense or [export.NONE_SELECTED],
+                           'street': filters.street or [export.NONE_SELECTED]}, doseq=True)
+        
+        return f"/export.csv?{query}", f"/export.parquet?{query}"
+    
+    @app.callback(
+        Output("comparison-chart", "figure"),
+        Input("compare-year-a", "value"),
+        Input("compare-year-b", "value"),
+        Input("data-ready", "data")
         )
-        # plot day wit number of incidents
-        line_chart.add_trace(
-            go.Scatter(x=crime_day.index, y=crime_day['incident_number']),
-            row=1, col=2
+    @measured
+    def compare_years(year_a, year_b, data_ready):
+        
+        if not data_ready:
+            raise PreventUpdate
+        
+        import figure_templates as ft
+        year_counts = state['year_counts']
+        
+        # years without reports cannot be compared
+        if year_a not in year_counts.years or year_b not in year_counts.years:
+            raise PreventUpdate
+        
+        # subtract the precomputed count vectors of both years
+        return ft.comparison_chart(year_counts.deltas(year_a, year_b), f"Change in Number of Incidents from {year_a} to {year_b}")
+    
+    @app.callback(
+        Output("drill-chart", "figure"),
+        Output("drill-district", "options"),
+        Output("drill-district", "value"),
+        Output("drill-street", "options"),
+        Output("drill-street", "value"),
+        Input("year-slider", "value"),
+        Input("drill-district", "value"),
+        Input("drill-street", "value"),
+        Input("drill-kind", "value"),
+        Input("drill-chart", "clickData"),
+        Input("data-ready", "data")
         )
-        # plot hour with number of incidents
-        line_chart.add_trace(
-            go.Scatter(x=crime_hour.index, y=crime_hour['incident_number']),
-            row=1, col=3
+    @measured
+    def drill_down(year, district, street, kind, click, data_ready):
+        
+        if not data_ready:
+            raise PreventUpdate
+        
+        import figure_templates as ft
+        from hierarchy import node_id
+        hierarchy = state['hierarchy']
+        year = int(year)
+        
+        # clicking a node drills into it, clicking the node on top goes back up a level
+        if dash.ctx.triggered_id == "drill-chart" and click:
+            clicked = click['points'][0].get('id')
+            path = hierarchy.path(year, clicked)
+            if clicked == node_id(district, street):
+                path = path[:-1]
+            district, street = (path + [None, None])[:2]
+        
+        # a new district starts from all of its streets
+        elif dash.ctx.triggered_id == "drill-district":
+            street = None
+        
+        # expand the selected nodes from the cached tree of the year
+        districts = hierarchy.children(year)['label'].tolist()
+        district = district if district in districts else None
+        streets = hierarchy.children(year, node_id(district))['label'].tolist() if district else []
+        street = street if street in streets else None
+        
+        drill_chart = ft.drill_chart(hierarchy.subtree(year, node_id(district, street)), kind,
+                                     f"Incidents in {year} by District, Street and Offense Description")
+        
+        return drill_chart, districts, district, streets, street
+    
+    @app.callback(
+        Output("animation1", "figure"),
+        Output("animation2", "figure"),
+        Output("animation3", "figure"),
+        Output("street_chart", "figure"),
+        Output("job-progress", "children"),
+        Output("job-poll", "disabled", allow_duplicate=True),
+        Output("delivered-jobs", "data"),
+        Input("figure-jobs", "data"),
+        Input("job-poll", "n_intervals"),
+        State("delivered-jobs", "data"),
+        prevent_initial_call=True
         )
+    @measured(log_when=lambda result: any(fig is not dash.no_update for fig in result[:4]))
+    def fill_background_charts(jobs, n_intervals, delivered):
         
-        # add title, x-axis labels, y-axis label
-        line_chart.update_layout(title_text=f"Number of Incidents for {offense_str} by Month, Day, and Hour in {year}", showlegend=False)
-        line_chart.update_yaxes(title_text='Number of Incidents', row=1, col=1)
-        line_chart.update_xaxes(title_text='Month', row=1, col=1)
-        line_chart.update_xaxes(title_text='Day', row=1, col=2)
-        line_chart.update_xaxes(title_text='Hour', row=1, col=3)
+        if jobs is None:
+            raise PreventUpdate
         
-        if len(street) == 0:
-            return dash.no_update
+        from jobs import animations_job, sankey_job
+        job_queue = state['job_queue']
         
-        elif isinstance(offense, str):
-            # plot all offenses when all filter is selected
-            # keep all offense code groups in DataFrame when all filter is selected
-            if offense == "All Offense Code Groups":
-                animation1 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('year'), lat='lat', lon='long', 
-                                               animation_frame='year', color='district', title=f'{offense} Occurences by Year from 2015 to 2022')
-                
-                animation2 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='mon_yr', color='district', title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
-                
-                animation3 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('day_mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='day_mon_yr', color='district', title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
-                
-                crime = crime_ybool
+        # fetch each background figure at most once per request
+        figures = {'animations': [dash.no_update] * 3, 'sankey': dash.no_update}
+        errors = []
+        for kind, job_fn in (('animations', animations_job), ('sankey', sankey_job)):
+            tag = f"{jobs['request']}:{kind}"
+            if tag in delivered:
+                continue
             
-            # plot selected single offense
-            # keep selected single offense code group in DataFrame
-            else:
-                
-                animation1 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('year'), lat='lat', lon='long', 
-                                               animation_frame='year', color='district', title=f'{offense} Occurences by Year from 2015 to 2022')
-                
-                animation2 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='mon_yr', color='district', title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
-                
-                animation3 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"]==offense].sort_values('day_mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='day_mon_yr', color='district', title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
-                
-                crime = crime_ybool[crime_ybool["offense_code_group"] == offense]
-       
-        elif isinstance(offense, list):
-            # plot all offenses when all filter is selected
-            # keep all offense code groups in DataFrame when all filter is selected
-            if "All Offense Code Groups" in offense:
-                
-                animation1 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('year'), lat='lat', lon='long', 
-                                               animation_frame='year', color='district', title=f'{offense} Occurences by Year from 2015 to 2022')
-                
-                animation2 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='mon_yr', color='district', title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
-                
-                animation3 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('day_mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='day_mon_yr', color='district', title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
-                
-                
-                
-                crime = crime_ybool
+            try:
+                if 'artifact' in jobs[kind]:
+                    result = figure_store.get(jobs[kind]['artifact'])
+                else:
+                    result = job_queue.poll(jobs[kind]['key'], job_fn, *jobs[kind]['args'])
+            except Exception as err:
+                errors.append(f"Could not render {kind}: {err}")
+                delivered.append(tag)
+                continue
             
-            # plot selected multiple offenses
-            # keep selected multiple offense code groups in DataFrame
-            else:
-                animation1 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('year'), lat='lat', lon='long', 
-                                               animation_frame='year', color='district', title=f'{offense} Occurences by Year from 2015 to 2022')
-                
-                animation2 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='mon_yr', color='district', title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
-                
-                animation3 = px.scatter_mapbox(data_frame=cr.data[cr.data["offense_code_group"].isin(offenses)].sort_values('day_mon_yr'), lat='lat', lon='long', 
-                                               animation_frame='day_mon_yr', color='district', title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
-                
-                
-                crime = crime_ybool[crime_ybool["offense_code_group"].isin(offense)]
-                
-        
-        
-        return animation1, animation2, animation3, graph_chart, bar_chart, line_chart, street_chart
+            if result is not None:
+                figures[kind] = result
+                delivered.append(tag)
+        
+        # report progress until both figures are in
+        # keep only this request's tags
+        delivered = [tag for tag in delivered if tag.startswith(jobs['request'])]
+        done = len(delivered) == 2
+        progress = " ".join(errors) if errors else ("" if done else f"Rendering figures: {len(delivered)} of 2 ready")
+        
+        animation1, animation2, animation3 = figures['animations']
+        return animation1, animation2, animation3, figures['sankey'], progress, done, delivered
+    
+    if PROFILE_STARTUP:
+        print(f"[startup] server ready after {time.perf_counter() - start:.2f}s", flush=True)
     
-    app.run_server(debug=True)
+    app.run_server(debug=debug)
     
 if __name__ == '__main__':
     main()
\ No newline at end of file
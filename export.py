@@ -0,0 +1,161 @@
+"""
+@file: export.py
+
+Export the crime reports behind a dashboard view. Rows are selected by position and
+streamed in chunks as CSV or Parquet, so a full filtered copy is never held in memory
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import importlib.util
+import io
+
+
+FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# query value of a dropdown with nothing selected, a missing parameter selects all options
+NONE_SELECTED = ''
+
+# pyarrow is optional, only parquet output needs it, and it is imported on first use since it is slow to import
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+def iter_chunks(cr, year=None, offenses=None, streets=None, chunksize=50000, cols=None):
+    '''
+    Purpose:
+        yield the crime reports matching the filters a chunk at a time
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        year (int): year to keep, None keeps all years
+        offenses (list): offense code groups to keep, None keeps all groups
+        streets (list): streets to keep, None keeps all streets
+        chunksize (int): number of rows per chunk
+        cols (list): columns to export, None exports all columns
+
+    Return:
+        generator of dataframes
+    '''
+
+    positions = cr.positions(year, offenses, streets)
+    col_positions = slice(None) if cols is None else [cr.data.columns.get_loc(col) for col in cols]
+
+    for start in range(0, len(positions), chunksize):
+        yield cr.data.iloc[positions[start:start + chunksize], col_positions]
+
+
+def stream_csv(cr, year=None, offenses=None, streets=None, chunksize=50000, cols=None):
+    '''
+    Purpose:
+        stream the matching crime reports as CSV text
+
+    Args:
+        same as iter_chunks
+
+    Return:
+        generator of CSV strings, the first one holding the header
+    '''
+
+    header = True
+    for chunk in iter_chunks(cr, year, offenses, streets, chunksize, cols):
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+    # header only when nothing matches
+    if header:
+        yield ','.join(cr.data.columns if cols is None else cols) + '\n'
+
+
+def stream_parquet(cr, year=None, offenses=None, streets=None, chunksize=50000, cols=None):
+    '''
+    Purpose:
+        stream the matching crime reports as a Parquet file, one row group per chunk
+
+    Args:
+        same as iter_chunks
+
+    Return:
+        generator of bytes of the Parquet file
+    '''
+
+    if not HAS_PYARROW:
+        raise ImportError("parquet export requires pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # parquet writer flushes each row group into the buffer, which is drained after every chunk
+    buffer = io.BytesIO()
+    schema = pa.Schema.from_pandas(cr.data.iloc[:0] if cols is None else cr.data[cols].iloc[:0], preserve_index=False)
+    with pq.ParquetWriter(buffer, schema) as writer:
+        for chunk in iter_chunks(cr, year, offenses, streets, chunksize, cols):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export(cr, path, fmt='csv', year=None, offenses=None, streets=None, chunksize=50000, cols=None):
+    '''
+    Purpose:
+        write the crime reports matching the filters to a file
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        path (str): file to write
+        fmt (str): csv or parquet
+        remaining args: same as iter_chunks
+
+    Return:
+        None, writes the file
+    '''
+
+    stream = stream_csv if fmt == 'csv' else stream_parquet
+    with open(path, 'w' if fmt == 'csv' else 'wb') as f:
+        for part in stream(cr, year, offenses, streets, chunksize, cols):
+            f.write(part)
+
+
+def _values(args, name, all_label):
+    ''' Dropdown values of a query parameter, all options when it is missing and none for NONE_SELECTED '''
+    values = args.getlist(name)
+    if not values:
+        return [all_label]
+    return [value for value in values if value != NONE_SELECTED]
+
+
+def register_routes(server, get_report):
+    '''
+    Purpose:
+        serve filtered exports at /export.csv and /export.parquet, taking the dashboard filter
+        state as query parameters, e.g. /export.csv?year=2018&offense=Larceny&street=All Streets
+
+    Args:
+        server (Flask): flask server behind the dash app
+        get_report (function): returns the loaded CrimeReport, or None while it is warming up
+
+    Return:
+        None, adds the route to the server
+    '''
+
+    from flask import Response, abort, request, stream_with_context
+    from filters import ALL_OFFENSES, ALL_STREETS, selected
+
+    @server.route('/export.<fmt>')
+    def export_view(fmt):
+        if fmt not in FORMATS or (fmt == 'parquet' and not HAS_PYARROW):
+            abort(404)
+
+        cr = get_report()
+        if cr is None:
+            abort(503)
+
+        # same dropdown values as update_charts, including the "All ..." options
+        year = request.args.get('year', type=int)
+        offenses = selected(_values(request.args, 'offense', ALL_OFFENSES), ALL_OFFENSES)
+        streets = selected(_values(request.args, 'street', ALL_STREETS), ALL_STREETS)
+
+        stream = stream_csv if fmt == 'csv' else stream_parquet
+        name = f"crime_{year or 'all'}.{fmt}"
+        return Response(stream_with_context(stream(cr, year, offenses, streets)), mimetype=FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename={name}'})
@@ -0,0 +1,230 @@
+"""
+@file: figure_templates.py
+
+Figure templates for the per-callback dashboard charts. Each layout is built and
+validated by plotly once, then every request only swaps in new trace arrays
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# columns shown when hovering over a point on the map
+HOVER_COLS = ["year", "offense_code_group", "offense_description", "district", "street", "datetime"]
+
+# columns the map scatter plot needs
+MAP_COLS = ["lat", "long", "incident_number"] + HOVER_COLS
+
+# approximate bytes one map point takes while its columns are gathered and the figure is serialized
+MAP_POINT_BYTES = 400
+
+
+@lru_cache(maxsize=None)
+def _map_template():
+    ''' Build the map scatter plot layout and trace once through plotly express '''
+
+    import plotly.express as px
+
+    # one placeholder row so plotly express lays out the figure like the real data
+    sample = pd.DataFrame({col: [0] for col in MAP_COLS})
+    graph_chart = px.scatter_mapbox(sample, lat="lat", lon="long",
+                                    hover_name="incident_number", hover_data=HOVER_COLS,
+                                    color_discrete_sequence=["fuchsia"], zoom=10, height=600)
+
+    # update map plot layout style and margins
+    graph_chart.update_layout(mapbox_style="open-street-map")
+    graph_chart.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+
+    return graph_chart.to_plotly_json()
+
+
+@lru_cache(maxsize=None)
+def _line_template():
+    ''' Build the month, day and hour subplots layout and traces once '''
+
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    # produce 3 subplots for month, day, and hour with subtitles
+    line_chart = make_subplots(rows=1, cols=3, subplot_titles=("Number of Incidents by Month", "Number of Incidents by Day", "Number of Incidents by Hour"))
+    for col in range(1, 4):
+        line_chart.add_trace(go.Scatter(x=[], y=[]), row=1, col=col)
+
+    # add x-axis labels, y-axis label
+    line_chart.update_layout(showlegend=False)
+    line_chart.update_yaxes(title_text='Number of Incidents', row=1, col=1)
+    line_chart.update_xaxes(title_text='Month', row=1, col=1)
+    line_chart.update_xaxes(title_text='Day', row=1, col=2)
+    line_chart.update_xaxes(title_text='Hour', row=1, col=3)
+
+    return line_chart.to_plotly_json()
+
+
+def map_chart(crime):
+    '''
+    Purpose:
+        fill the map scatter plot template with the incidents to plot
+
+    Args:
+        crime (DataFrame/dict): crime reports to plot, or their MAP_COLS columns as arrays
+
+    Return:
+        dict figure of map scatter plot
+    '''
+
+    template = _map_template()
+    lat = np.asarray(crime["lat"])
+    lon = np.asarray(crime["long"])
+
+    # hover columns are stacked straight into the customdata array, without an intermediate frame
+    customdata = np.empty((len(lat), len(HOVER_COLS)), dtype=object)
+    for num, col in enumerate(HOVER_COLS):
+        customdata[:, num] = pd.Series(crime[col], copy=False).to_numpy(dtype=object)
+
+    # swap trace arrays into a shallow copy of the template trace
+    trace = dict(template['data'][0], lat=lat, lon=lon,
+                 hovertext=np.asarray(crime["incident_number"]), customdata=customdata)
+
+    # plotly express centers the map on the mean location
+    layout = dict(template['layout'])
+    if len(lat) > 0:
+        layout['mapbox'] = dict(layout['mapbox'], center={'lat': lat.mean(), 'lon': lon.mean()})
+
+    return {'data': [trace], 'layout': layout}
+
+
+def add_hotspots(graph_chart, spots):
+    '''
+    Purpose:
+        overlay hotspot cells on a filled map scatter plot
+
+    Args:
+        graph_chart (dict): figure from map_chart
+        spots (DataFrame): hotspots from HotspotEngine, with lat, long, count and density
+
+    Return:
+        dict figure with a hotspot layer on top of the incidents
+    '''
+
+    density = spots['density'].to_numpy()
+    size = 10 + 30 * density / density.max() if len(spots) > 0 else []
+    layer = {'type': 'scattermapbox', 'name': 'Hotspots', 'mode': 'markers',
+             'lat': spots['lat'].to_numpy(), 'lon': spots['long'].to_numpy(),
+             'marker': {'size': size, 'color': density, 'colorscale': 'YlOrRd', 'opacity': 0.6},
+             'text': spots['count'].to_numpy(), 'hovertemplate': 'Hotspot: %{text} incidents<extra></extra>'}
+
+    return dict(graph_chart, data=graph_chart['data'] + [layer])
+
+
+def line_chart(counts, title):
+    '''
+    Purpose:
+        fill the line chart template with the number of incidents by month, day and hour
+
+    Args:
+        counts (dict): month, day_of_week and hour series of counts from CrimeReport.histograms
+        title (str): title of the figure
+
+    Return:
+        dict figure of line chart subplots
+    '''
+
+    template = _line_template()
+
+    # swap count arrays into shallow copies of the template traces
+    hists = [counts['month'], counts['day_of_week'], counts['hour']]
+    traces = [dict(trace, x=hist.index.to_numpy(), y=hist.to_numpy())
+              for trace, hist in zip(template['data'], hists)]
+
+    layout = dict(template['layout'], title={'text': title})
+
+    return {'data': traces, 'layout': layout}
+
+
+@lru_cache(maxsize=None)
+def _comparison_template():
+    ''' Build the year over year delta subplots layout and traces once '''
+
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    # produce 3 bar subplots for offense code group, district and hour deltas
+    comparison_chart = make_subplots(rows=1, cols=3, subplot_titles=("Change by Offense Code Group", "Change by District", "Change by Hour"))
+    for col in range(1, 4):
+        comparison_chart.add_trace(go.Bar(x=[], y=[]), row=1, col=col)
+
+    comparison_chart.update_layout(showlegend=False, height=500)
+    comparison_chart.update_yaxes(title_text='Change in Number of Incidents', row=1, col=1)
+    comparison_chart.update_xaxes(title_text='Offense Code Group', row=1, col=1)
+    comparison_chart.update_xaxes(title_text='District', row=1, col=2)
+    comparison_chart.update_xaxes(title_text='Hour', row=1, col=3)
+
+    return comparison_chart.to_plotly_json()
+
+
+def comparison_chart(deltas, title):
+    '''
+    Purpose:
+        fill the year over year template with the change in incidents per category
+
+    Args:
+        deltas (dict): offense_code_group, district and hour dataframes from YearCounts.deltas
+        title (str): title of the figure
+
+    Return:
+        dict figure of bar chart subplots
+    '''
+
+    template = _comparison_template()
+
+    traces = []
+    for trace, dim in zip(template['data'], ['offense_code_group', 'district', 'hour']):
+        delta = deltas[dim]['delta'].to_numpy()
+        # increases in red, decreases in green
+        traces.append(dict(trace, x=deltas[dim].index.to_numpy(), y=delta,
+                           marker={'color': np.where(delta > 0, 'crimson', 'seagreen')}))
+
+    layout = dict(template['layout'], title={'text': title})
+
+    return {'data': traces, 'layout': layout}
+
+
+@lru_cache(maxsize=None)
+def _drill_template():
+    ''' Build the drill-down treemap layout and trace once '''
+
+    import plotly.graph_objects as go
+
+    drill_chart = go.Figure(go.Treemap(ids=[], labels=[], parents=[], values=[], branchvalues='total',
+                                       textinfo='label+value'))
+    drill_chart.update_layout(margin={"r":0,"t":40,"l":0,"b":0}, height=600)
+
+    return drill_chart.to_plotly_json()
+
+
+def drill_chart(subtree, kind, title):
+    '''
+    Purpose:
+        fill the drill-down template with a subtree of district, street and offense description counts
+
+    Args:
+        subtree (dict): ids, labels, parents and values from CrimeHierarchy.subtree
+        kind (str): treemap or sunburst
+        title (str): title of the figure
+
+    Return:
+        dict figure of the treemap or sunburst
+    '''
+
+    template = _drill_template()
+
+    # treemap and sunburst traces take the same hierarchy arrays
+    trace = dict(template['data'][0], type=kind, ids=subtree['ids'], labels=subtree['labels'],
+                 parents=subtree['parents'], values=subtree['values'])
+    layout = dict(template['layout'], title={'text': title})
+
+    return {'data': [trace], 'layout': layout}
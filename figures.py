@@ -0,0 +1,80 @@
+"""
+@file: figures.py
+
+Figure builders shared by the dashboard and the precompute step
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import plotly.express as px
+import sankey as ms
+
+
+def make_bar_chart(crime_obool, year):
+    '''
+    Purpose:
+        plot bar chart of offense code groups and number of incidents for selected year
+
+    Args:
+        crime_obool (DataFrame): year/offense grouped counts filtered to the selected year
+        year (int): year selected
+
+    Return:
+        plotly figure of bar chart
+    '''
+
+    # add title, x-axis label, y-axis label
+    bar_chart = px.bar(crime_obool, x=crime_obool.index, y=crime_obool["incident_number"])
+    bar_chart.update_layout(height = 600, title_text=f"Number of Incidents for Each Offense Code Group in {year}", xaxis={'categoryorder':'total descending'})
+    bar_chart.update_xaxes(title_text="Offense Code Group")
+    bar_chart.update_yaxes(title_text='Number of Incidents')
+
+    return bar_chart
+
+
+def make_animations(data, offense):
+    '''
+    Purpose:
+        create map animations of incidents by year, month and day
+
+    Args:
+        data (DataFrame): crime reports across all years, already filtered to the offenses to plot
+        offense (str): offense label used in the animation titles
+
+    Return:
+        tuple of plotly figures for the year, month and day animations
+    '''
+
+    animation1 = px.scatter_mapbox(data_frame=data.sort_values('year'), lat='lat', lon='long',
+                                   animation_frame='year', color='district', title=f'{offense} Occurences by Year from 2015 to 2022')
+
+    animation2 = px.scatter_mapbox(data_frame=data.sort_values('mon_yr'), lat='lat', lon='long',
+                                   animation_frame='mon_yr', color='district', title=f'{offense} Occurences by Month from Aug 2015 to Apr 2022')
+
+    animation3 = px.scatter_mapbox(data_frame=data.sort_values('day_mon_yr'), lat='lat', lon='long',
+                                   animation_frame='day_mon_yr', color='district', title=f'{offense} Occurences by Day from June 1, 2015 to April 20, 2022')
+
+    return animation1, animation2, animation3
+
+
+def make_street_sankey(cr, year, streets, offenses, count):
+    '''
+    Purpose:
+        create street to crime sankey diagram for the selected streets and offense code groups
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        year (int): year selected
+        streets (list): streets to keep, None keeps all streets
+        offenses (list): offense code groups to keep, None keeps all groups
+        count (int): minimum number of crimes for a street/offense pair
+
+    Return:
+        plotly figure of sankey diagram
+    '''
+
+    # count crimes by street and offense code group, in descending order, filtered by count
+    # create Sankey diagram
+    # source used: https://github.ccs.neu.edu/rachlin/ds3500_sp22
+    crime_sankey = cr.street_offense_counts(year, streets, offenses, count)
+    return ms.make_sankey(crime_sankey, 'street', 'offense_code_group', 'count')
@@ -0,0 +1,150 @@
+"""
+@file: filters.py
+
+Resolve the dashboard filters once per request. Dropdown values are normalized in one
+place and every distinct subset of crime reports is computed once, as row positions,
+then shared by all the figures built for the request instead of each filtering a copy
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import numpy as np
+
+
+ALL_OFFENSES = "All Offense Code Groups"
+ALL_STREETS = "All Streets"
+
+
+def selected(value, all_label):
+    '''
+    Purpose:
+        normalize a dropdown value to the list of selected options
+
+    Args:
+        value (str/list): single or multiple dropdown selection
+        all_label (str): option standing for every value, e.g. "All Streets"
+
+    Return:
+        list of selected options, or None when the all option is selected
+    '''
+
+    values = [value] if isinstance(value, str) else list(value)
+    return None if all_label in values else values
+
+
+class FilterState:
+
+    def __init__(self, year, offense, street=ALL_STREETS, crime=ALL_OFFENSES):
+        """Constructor"""
+
+        # convert year to integer
+        self.year = int(year)
+
+        # raw dropdown values as lists, so empty selections can be told apart from all
+        self.offense = [offense] if isinstance(offense, str) else list(offense)
+        self.street = [street] if isinstance(street, str) else list(street)
+        self.crime = [crime] if isinstance(crime, str) else list(crime)
+
+        # selected values for the map filter and the street to crime sankey filters, None for all
+        self.offenses = selected(self.offense, ALL_OFFENSES)
+        self.streets = selected(self.street, ALL_STREETS)
+        self.crimes = selected(self.crime, ALL_OFFENSES)
+
+        # make string of offenses
+        self.offense_str = ", ".join(self.offense)
+
+
+class RowSelection:
+
+    def __init__(self, cr, max_rows=None):
+        """Constructor"""
+
+        # cleaned crime reports the subsets are taken from
+        self.cr = cr
+
+        # most rows one figure may gather, None gathers every matching row
+        self.max_rows = max_rows
+
+        # row positions and gathered columns of each subset computed for this request
+        self._positions = {}
+        self._columns = {}
+
+    @staticmethod
+    def _key(year, offenses, streets):
+        return (year,
+                None if offenses is None else tuple(sorted(offenses)),
+                None if streets is None else tuple(sorted(streets)))
+
+    def positions(self, year=None, offenses=None, streets=None):
+        '''
+        Purpose:
+            row positions of the crime reports matching the filters, computed once per distinct subset
+
+        Args:
+            year (int): year to keep, None keeps all years
+            offenses (list): offense code groups to keep, None keeps all groups
+            streets (list): streets to keep, None keeps all streets
+
+        Return:
+            numpy array of row positions, or None when the backend selects rows itself
+        '''
+
+        if not self.cr.positional:
+            return None
+
+        key = self._key(year, offenses, streets)
+        if key not in self._positions:
+            if offenses is None and streets is None:
+                self._positions[key] = self.cr.positions(year)
+            else:
+                # narrow the year's rows rather than masking the whole dataset again
+                positions = self.positions(year)
+                keep = np.ones(len(positions), dtype=bool)
+                if offenses is not None:
+                    keep &= np.isin(self.cr.take('offense_code_group', positions), list(offenses))
+                if streets is not None:
+                    keep &= np.isin(self.cr.take('street', positions), list(streets))
+                self._positions[key] = positions[keep]
+
+        return self._positions[key]
+
+    def columns(self, cols, year=None, offenses=None):
+        '''
+        Purpose:
+            gather only the needed columns of a subset, each column once per request,
+            thinned to an evenly spaced sample of max_rows rows when the subset is larger
+
+        Args:
+            cols (list): columns to gather
+            year (int): year to keep, None keeps all years
+            offenses (list): offense code groups to keep, None keeps all groups
+
+        Return:
+            dict of column name to numpy array, or a dataframe from the backend when it selects rows itself
+        '''
+
+        positions = self.positions(year, offenses)
+        if positions is None:
+            crime = self.cr.incidents(year, offenses, cols)
+            return crime if self.max_rows is None or len(crime) <= self.max_rows else crime.iloc[self._thin(len(crime))]
+
+        if self.max_rows is not None and len(positions) > self.max_rows:
+            positions = positions[self._thin(len(positions))]
+
+        key = self._key(year, offenses, None)
+        for col in cols:
+            if (key, col) not in self._columns:
+                self._columns[key, col] = self.cr.take(col, positions)
+        return {col: self._columns[key, col] for col in cols}
+
+    def _thin(self, rows):
+        ''' Evenly spaced positions of max_rows out of rows '''
+        return np.linspace(0, rows - 1, self.max_rows).astype(np.int64)
+
+    def offense_groups(self, year):
+        ''' Offense code groups reported in a year, from the year's shared row positions '''
+        return self.cr.offense_groups(year, positions=self.positions(year))
+
+    def histograms(self, year, offenses=None):
+        ''' Month, day of week and hour counts of a subset, from its shared row positions '''
+        return self.cr.histograms(year, offenses, positions=self.positions(year, offenses))
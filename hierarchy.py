@@ -0,0 +1,180 @@
+"""
+@file: hierarchy.py
+
+District, street and offense description hierarchy of crime counts for drill-down charts.
+Leaf counts for every year are grouped once, each year's tree is assembled the first
+time it is requested, and expanding a node reads its children from the cached tree
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# levels of the hierarchy, top first
+LEVELS = ['district', 'street', 'offense_description']
+
+# id of the root node and separator between the levels of a node id
+ROOT = 'All Districts'
+SEP = '/'
+
+# label of reports missing a level, so every report is counted under some node
+UNKNOWN = 'Unknown'
+
+
+def node_id(*path):
+    '''
+    Purpose:
+        id of the node reached by following a path of labels down from the root
+
+    Args:
+        *path (str): district, street and offense description labels, in order, None ends the path
+
+    Return:
+        str node id, ROOT for an empty path
+    '''
+
+    path = [label for label in path if label is not None]
+    return SEP.join(path) if path else ROOT
+
+
+def _labeled(values):
+    ''' Level values with missing ones labeled UNKNOWN, adding the category to categorical columns '''
+    if isinstance(values.dtype, pd.CategoricalDtype) and UNKNOWN not in values.cat.categories:
+        values = values.cat.add_categories(UNKNOWN)
+    return values.fillna(UNKNOWN)
+
+
+class CrimeHierarchy:
+
+    def __init__(self, data, cache=None):
+        """Constructor"""
+
+        # leaf counts of every year in one groupby, totals match the charts since no report is dropped
+        keys = [data['year']] + [_labeled(data[level]) for level in LEVELS]
+        self._leaves = pd.Series(1, index=data.index).groupby(keys, observed=True).size().rename('count')
+
+        # assembled trees by year, a SpillCache bounds how many stay in memory
+        self._trees = {} if cache is None else cache
+
+    @property
+    def years(self):
+        return self._leaves.index.get_level_values('year').unique()
+
+    def tree(self, year):
+        '''
+        Purpose:
+            assemble (once) the tree of counts of a year from its leaf counts
+
+        Args:
+            year (int): year selected
+
+        Return:
+            dict of ids, labels, parents and values arrays in plotly treemap order,
+            plus positions of each node by id and positions of its children by parent id
+        '''
+
+        # a spilled tree whose file is gone is rebuilt
+        tree = self._trees.get(year)
+        if tree is not None:
+            return tree
+
+        leaves = self._leaves.xs(year, level='year') if year in self.years else self._leaves.iloc[:0].droplevel('year')
+
+        ids, labels, parents, values = [ROOT], [ROOT], [''], [int(leaves.sum())]
+
+        # each level sums the level below it, so the tree is built from the leaf counts alone
+        for depth in range(len(LEVELS)):
+            counts = leaves.groupby(level=LEVELS[:depth + 1], observed=True).sum() if depth < len(LEVELS) - 1 else leaves
+            paths = counts.index.to_frame(index=False).astype(str).to_numpy()
+            ids.extend(SEP.join(path) for path in paths)
+            labels.extend(paths[:, -1])
+            parents.extend(SEP.join(path[:-1]) if depth > 0 else ROOT for path in paths)
+            values.extend(counts.to_numpy().tolist())
+
+        tree = {'ids': np.array(ids, dtype=object), 'labels': np.array(labels, dtype=object),
+                'parents': np.array(parents, dtype=object), 'values': np.array(values)}
+        tree['index'] = {node: pos for pos, node in enumerate(ids)}
+
+        # children of every node, largest first
+        order = np.lexsort((-tree['values'][1:], tree['parents'][1:])) + 1
+        parents_sorted = tree['parents'][order]
+        starts = np.flatnonzero(np.r_[True, parents_sorted[1:] != parents_sorted[:-1]]) if len(order) else []
+        ends = np.r_[starts[1:], len(order)]
+        tree['children'] = {parents_sorted[start]: order[start:end] for start, end in zip(starts, ends)}
+
+        self._trees[year] = tree
+        return tree
+
+    def children(self, year, node=ROOT):
+        '''
+        Purpose:
+            expand a node of a year's tree
+
+        Args:
+            year (int): year selected
+            node (str): id of the node to expand
+
+        Return:
+            dataframe of id, label and count of each child, largest first
+        '''
+
+        tree = self.tree(year)
+        pos = tree['children'].get(node, np.empty(0, dtype=int))
+        return pd.DataFrame({'id': tree['ids'][pos], 'label': tree['labels'][pos], 'count': tree['values'][pos]})
+
+    def path(self, year, node):
+        '''
+        Purpose:
+            labels of the nodes from the top of a year's tree down to a node
+
+        Args:
+            year (int): year selected
+            node (str): node id
+
+        Return:
+            list of district, street and offense description labels, empty for the root or an unknown node
+        '''
+
+        tree = self.tree(year)
+        path = []
+        while node in tree['index'] and node != ROOT:
+            pos = tree['index'][node]
+            path.insert(0, tree['labels'][pos])
+            node = tree['parents'][pos]
+        return path
+
+    def subtree(self, year, node=ROOT, depth=2):
+        '''
+        Purpose:
+            the part of a year's tree below a node, so charts only send the levels being shown
+
+        Args:
+            year (int): year selected
+            node (str): id of the node at the top of the subtree
+            depth (int): number of levels below the node to include
+
+        Return:
+            dict of ids, labels, parents and values arrays with node as the root
+        '''
+
+        tree = self.tree(year)
+        if node not in tree['index']:
+            node = ROOT
+
+        positions = [np.array([tree['index'][node]])]
+        frontier = [node]
+        for _ in range(depth):
+            level = [tree['children'][parent] for parent in frontier if parent in tree['children']]
+            if not level:
+                break
+            level = np.concatenate(level)
+            positions.append(level)
+            frontier = tree['ids'][level]
+        positions = np.concatenate(positions)
+
+        parents = tree['parents'][positions].copy()
+        parents[0] = ''
+        return {'ids': tree['ids'][positions], 'labels': tree['labels'][positions],
+                'parents': parents, 'values': tree['values'][positions]}
@@ -0,0 +1,160 @@
+"""
+@file: hotspots.py
+
+Hotspot detection over incident locations. Incidents are binned into a lat/long grid
+for every offense code group in one vectorized pass, smoothed with a gaussian kernel
+(a grid approximation of kernel density) and the densest cells are flagged as hotspots
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _kernel_matrix(size, bandwidth):
+    ''' Banded gaussian smoothing matrix, so smoothing a grid is two matrix products '''
+    pos = np.arange(size)
+    kernel = np.exp(-0.5 * ((pos[:, None] - pos[None, :]) / bandwidth) ** 2)
+    kernel[kernel < 1e-4] = 0
+    return kernel
+
+
+def _smooth(counts, row_kernel, col_kernel):
+    '''
+    Purpose:
+        gaussian smooth a stack of grids, one per offense code group, all at once
+
+    Args:
+        counts (ndarray): grids of counts shaped (groups, rows, cols)
+        row_kernel (ndarray): smoothing matrix along latitude
+        col_kernel (ndarray): smoothing matrix along longitude
+
+    Return:
+        ndarray of smoothed grids with the same shape
+    '''
+
+    return np.einsum('ij,gjk,lk->gil', row_kernel, counts, col_kernel, optimize=True)
+
+
+class HotspotEngine:
+
+    def __init__(self, data, cell_size=0.0025, bandwidth=1.5, threshold=2.0, cache=None):
+        """Constructor"""
+
+        # grid cell size in degrees (about 250m) and smoothing bandwidth in cells
+        self.cell_size = cell_size
+        self.bandwidth = bandwidth
+
+        # z-score of smoothed density above which a cell is a hotspot
+        self.threshold = threshold
+
+        lat = data['lat'].to_numpy()
+        lon = data['long'].to_numpy()
+
+        # grid covering the bulk of the incidents, ignoring stray coordinates
+        self.lat_min, lat_max = np.nanpercentile(lat, [0.1, 99.9])
+        self.lon_min, lon_max = np.nanpercentile(lon, [0.1, 99.9])
+        self.shape = (int((lat_max - self.lat_min) / cell_size) + 1, int((lon_max - self.lon_min) / cell_size) + 1)
+
+        # cell of every incident computed once, -1 when outside the grid
+        rows = np.floor((lat - self.lat_min) / cell_size)
+        cols = np.floor((lon - self.lon_min) / cell_size)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        self._cells = np.where(inside, rows * self.shape[1] + cols, -1).astype(np.int64)
+
+        # offense code group codes and times of every incident
+        self._groups, self.group_names = pd.factorize(data['offense_code_group'])
+        self._times = data['datetime'].to_numpy()
+
+        self._row_kernel = _kernel_matrix(self.shape[0], bandwidth)
+        self._col_kernel = _kernel_matrix(self.shape[1], bandwidth)
+
+        # smoothed grids by time window, a SpillCache bounds how many stay in memory
+        self._cache = {} if cache is None else cache
+
+    def grids(self, start=None, end=None, processes=None):
+        '''
+        Purpose:
+            count and smooth incidents per grid cell for every offense code group in a time window
+
+        Args:
+            start (Timestamp): first time to include, None for no lower bound
+            end (Timestamp): time to stop before, None for no upper bound
+            processes (int): smooth groups in a process pool of this size, None smooths in this process
+
+        Return:
+            tuple of ndarrays of incident counts and smoothed densities, both shaped (groups, rows, cols)
+            and ordered like group_names
+        '''
+
+        key = (start, end)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        mask = self._cells >= 0
+        if start is not None:
+            mask &= self._times >= np.datetime64(start)
+        if end is not None:
+            mask &= self._times < np.datetime64(end)
+
+        # one bincount over (group, cell) pairs bins every group at once
+        ncells = self.shape[0] * self.shape[1]
+        flat = self._groups[mask] * ncells + self._cells[mask]
+        counts = np.bincount(flat, minlength=len(self.group_names) * ncells)
+        counts = counts.reshape(len(self.group_names), *self.shape).astype(float)
+
+        if processes and len(self.group_names) > 1:
+            chunks = np.array_split(counts, min(processes, len(counts)))
+            with ProcessPoolExecutor(processes) as pool:
+                smoothed = list(pool.map(_smooth, chunks, [self._row_kernel] * len(chunks), [self._col_kernel] * len(chunks)))
+            smoothed = np.concatenate(smoothed)
+        else:
+            smoothed = _smooth(counts, self._row_kernel, self._col_kernel)
+
+        self._cache[key] = (counts, smoothed)
+        return self._cache[key]
+
+    def hotspots(self, offenses=None, start=None, end=None):
+        '''
+        Purpose:
+            flag the grid cells whose smoothed density stands out for the selected offense code groups
+
+        Args:
+            offenses (list): offense code groups to include, None includes all groups
+            start (Timestamp): first time to include, None for no lower bound
+            end (Timestamp): time to stop before, None for no upper bound
+
+        Return:
+            dataframe of lat, long (cell centers), count and density of each hotspot, densest first
+        '''
+
+        counts, smoothed = self.grids(start, end)
+
+        # smoothing is linear, so summing the cached per group grids is exact
+        if offenses is None:
+            groups = slice(None)
+        else:
+            groups = np.flatnonzero(self.group_names.isin(offenses))
+        count = counts[groups].sum(axis=0)
+        density = smoothed[groups].sum(axis=0)
+
+        # z-score against cells near any incident, so empty water and parks do not dilute it
+        occupied = density > 1e-9
+        if occupied.sum() < 2:
+            return pd.DataFrame(columns=['lat', 'long', 'count', 'density'])
+        mean, std = density[occupied].mean(), density[occupied].std()
+        rows, cols = np.nonzero(occupied & (density >= mean + self.threshold * std))
+
+        spots = pd.DataFrame({'lat': self.lat_min + (rows + 0.5) * self.cell_size,
+                              'long': self.lon_min + (cols + 0.5) * self.cell_size,
+                              'count': count[rows, cols].astype(int),
+                              'density': density[rows, cols]})
+        return spots.sort_values('density', ascending=False, ignore_index=True)
+
+    def year_hotspots(self, year, offenses=None):
+        ''' Hotspots of the selected offense code groups within a calendar year '''
+        return self.hotspots(offenses, pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year + 1, month=1, day=1))
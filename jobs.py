@@ -0,0 +1,252 @@
+"""
+@file: jobs.py
+
+Background job queue for expensive figures, run on a local process pool so slow
+builds never block the worker answering dashboard callbacks
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# cleaned crime reports loaded once per worker process
+_DATA = None
+_REPORT = None
+
+
+def _init_worker(data_path, mapbox_token, db_path=None, engine=None, results=(None, None), streets=None):
+    ''' Load the cleaned dataframe and its street lookup, open the SQL database if one is used and share the result cache, in a worker process '''
+
+    global _DATA, _REPORT
+    _DATA = pd.read_pickle(data_path)
+
+    if db_path is None:
+        from crime_dash_library import CrimeReport
+        _REPORT = CrimeReport()
+    else:
+        from crime_sql import SQLCrimeReport
+        _REPORT = SQLCrimeReport(engine)
+        _REPORT.open_database(db_path)
+    _REPORT.data = _DATA
+    if streets is not None:
+        _REPORT.streets = streets
+    _REPORT.use_results(*results)
+
+    import plotly.express as px
+    px.set_mapbox_access_token(mapbox_token)
+
+
+def animations_job(offenses, label, out_dir=None):
+    '''
+    Purpose:
+        build the year, month and day animations for a set of offense code groups in a worker
+
+    Args:
+        offenses (list): offense code groups to animate
+        label (str): offense label used in the animation titles
+        out_dir (str): directory to also store the animations in as a pre-rendered artifact
+
+    Return:
+        list of figure dicts
+    '''
+
+    from figures import make_animations
+
+    animations = make_animations(_DATA[_DATA['offense_code_group'].isin(offenses)], label)
+
+    # later requests for the same set load the artifact instead of queueing a build
+    if out_dir is not None:
+        from precompute import _write_artifact, animation_name
+        _write_artifact(out_dir, animation_name(offenses, label), '[' + ','.join(fig.to_json() for fig in animations) + ']')
+
+    return [fig.to_dict() for fig in animations]
+
+
+def sankey_job(year, streets, offenses, count):
+    '''
+    Purpose:
+        build the street to crime sankey diagram for the selected year and filters in a worker
+
+    Args:
+        year (int): year selected
+        streets (list): streets to keep, None keeps all streets
+        offenses (list): offense code groups to keep, None keeps all groups
+        count (int): minimum number of crimes for a street/offense pair
+
+    Return:
+        figure dict
+    '''
+
+    from figures import make_street_sankey
+
+    return make_street_sankey(_REPORT, year, streets, offenses, count).to_dict()
+
+
+def render_job(offense, out_dir, fmt):
+    '''
+    Purpose:
+        render the animation set and the yearly line charts of one offense code group to files in a worker
+
+    Args:
+        offense (str): offense code group to render
+        out_dir (str): directory to write the group's files to
+        fmt (str): html for standalone pages or json for figure JSON
+
+    Return:
+        list of file paths written
+    '''
+
+    import os
+    import plotly.io as pio
+    import figure_templates as ft
+    from figures import make_animations
+
+    os.makedirs(out_dir, exist_ok=True)
+    figures = dict(zip(['year_animation', 'month_animation', 'day_animation'],
+                       make_animations(_DATA[_DATA['offense_code_group'] == offense], offense)))
+    for year in sorted(_DATA.loc[_DATA['offense_code_group'] == offense, 'year'].unique()):
+        figures[f'line_{year}'] = ft.line_chart(_REPORT.histograms(year, [offense]),
+                                                f"Number of Incidents for {offense} by Month, Day, and Hour in {year}")
+
+    # write to a temporary file first so an interrupted run never leaves a truncated figure
+    paths = []
+    for name, fig in figures.items():
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        tmp = f'{path}.tmp'
+        if fmt == 'html':
+            pio.write_html(fig, tmp, include_plotlyjs='cdn', validate=False)
+        else:
+            pio.write_json(fig, tmp, validate=False)
+        os.replace(tmp, path)
+        paths.append(path)
+
+    return paths
+
+
+class FigureJobQueue:
+
+    def __init__(self, data, data_path, mapbox_token, db_path=None, engine=None, max_workers=None, keep=32,
+                 results=(None, None), streets=None):
+        """Constructor"""
+
+        # workers read the cleaned dataframe from disk instead of reloading the csv files,
+        # and share the result cache of the dashboard process. The file is replaced atomically,
+        # other dashboard processes may be starting workers from the same path
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(data_path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data.to_pickle(f)
+            os.replace(tmp, data_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                             initargs=(data_path, mapbox_token, db_path, engine, results, streets))
+
+        # futures by job key, oldest first, so identical requests share one build
+        self._jobs = OrderedDict()
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        '''
+        Purpose:
+            queue a figure build unless an identical one is already queued, running or finished
+
+        Args:
+            key (str): job key identifying the filter state
+            fn (function): module level job function to run in a worker
+            *args: arguments passed to the job function
+
+        Return:
+            str job key
+        '''
+
+        with self._lock:
+            if key in self._jobs:
+                self._jobs.move_to_end(key)
+                return key
+
+            self._jobs[key] = self._executor.submit(fn, *args)
+
+            # forget the oldest finished jobs
+            while len(self._jobs) > self._keep:
+                oldest = next(iter(self._jobs))
+                if not self._jobs[oldest].done():
+                    break
+                del self._jobs[oldest]
+
+        return key
+
+    def result(self, key):
+        '''
+        Purpose:
+            fetch a finished build without blocking
+
+        Args:
+            key (str): job key returned by submit
+
+        Return:
+            job result, or None if it is still running, raises the job's exception if it failed
+        '''
+
+        with self._lock:
+            future = self._jobs.get(key)
+
+        if future is None or not future.done():
+            return None
+
+        if future.exception() is not None:
+            # allow the failed build to be submitted again
+            with self._lock:
+                self._jobs.pop(key, None)
+            raise future.exception()
+
+        return future.result()
+
+    def wait(self, key):
+        '''
+        Purpose:
+            block until a build finishes
+
+        Args:
+            key (str): job key returned by submit
+
+        Return:
+            job result, or None if the job was forgotten, raises the job's exception if it failed
+        '''
+
+        with self._lock:
+            future = self._jobs.get(key)
+
+        if future is None:
+            return None
+        future.exception()
+        return self.result(key)
+
+    def poll(self, key, fn, *args):
+        '''
+        Purpose:
+            make sure a build is queued and fetch it if finished, so a request whose job was
+            forgotten (or queued by another dashboard process) is rebuilt rather than lost
+
+        Args:
+            key (str): job key identifying the filter state
+            fn (function): module level job function to run in a worker
+            *args: arguments passed to the job function
+
+        Return:
+            job result, or None if it is still running
+        '''
+
+        return self.result(self.submit(key, fn, *args))
+
+    def shutdown(self):
+        ''' Stop the worker processes '''
+        self._executor.shutdown(wait=False, cancel_futures=True)
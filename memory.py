@@ -0,0 +1,307 @@
+"""
+@file: memory.py
+
+Memory-bounded mode for multi-user deployments. A memory budget caps the rows a request
+may gather, bounds the precomputed aggregates kept in memory (spilling the least recently
+used ones to disk) and reports the process peak RSS while each callback runs, so containers
+can be sized. RSS is process-wide, callbacks running at the same time share their peaks
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import atexit
+import itertools
+import os
+import pickle
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# psutil is optional, /proc is read directly on linux otherwise
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+MB = 2 ** 20
+
+
+def rss_bytes():
+    ''' Current resident set size of this process, falling back to its peak when it cannot be read '''
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on linux and bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def sizeof(value):
+    '''
+    Purpose:
+        estimate the memory held by a cached aggregate
+
+    Args:
+        value (object): array, dataframe, series or a dict/list/tuple of them
+
+    Return:
+        int number of bytes
+    '''
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class SpillCache:
+
+    def __init__(self, max_bytes=None, spill_dir=None):
+        """Constructor"""
+
+        # bytes of values kept in memory before the least recently used are spilled, None never spills
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+
+        # private directory under spill_dir, created on the first spill and removed at exit,
+        # so caches of other processes sharing spill_dir never touch these files
+        self._dir = None
+        self._names = itertools.count()
+
+        # in memory values and their sizes, least recently used first
+        self._items = OrderedDict()
+        self._bytes = 0
+
+        # files of spilled values by key
+        self._spilled = {}
+
+        # callbacks run on several threads
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items or key in self._spilled
+
+    def __getitem__(self, key):
+        '''
+        Purpose:
+            fetch a cached value, reading it back from disk if it was spilled
+
+        Args:
+            key (hashable): cache key
+
+        Return:
+            cached value, raises KeyError if it was never cached or its spill file is gone
+        '''
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key][0]
+
+            path = self._spilled.pop(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self._remove(path)
+                raise KeyError(key)
+            self._remove(path)
+            self[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def get(self, key, default=None):
+        ''' Cached value, or default if it was never cached or its spill file is gone '''
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def put(self, key, value, nbytes=None):
+        '''
+        Purpose:
+            cache a value, spilling the least recently used values to disk while over the budget
+
+        Args:
+            key (hashable): cache key
+            value (object): picklable value
+            nbytes (int): size of the value, estimated when None
+
+        Return:
+            None, updates the cache
+        '''
+
+        nbytes = sizeof(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._spilled:
+                self._remove(self._spilled.pop(key))
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+
+            # the value just added always stays in memory
+            while self.max_bytes is not None and self._bytes > self.max_bytes and len(self._items) > 1:
+                self._spill(next(iter(self._items)))
+
+    def _spill(self, key):
+        ''' Write one value to disk atomically and drop it from memory '''
+
+        value, nbytes = self._items.pop(key)
+        self._bytes -= nbytes
+
+        if self._dir is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._dir = tempfile.mkdtemp(dir=self.spill_dir)
+            atexit.register(shutil.rmtree, self._dir, ignore_errors=True)
+
+        path = os.path.join(self._dir, f'{next(self._names)}.pkl')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._spilled[key] = path
+
+    @staticmethod
+    def _remove(path):
+        # the spill directory may have been cleaned up from outside
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def nbytes(self):
+        ''' Bytes of values currently held in memory '''
+        return self._bytes
+
+
+class MemoryBudget:
+
+    def __init__(self, budget_mb, spill_dir, interval=0.02):
+        """Constructor"""
+
+        # a quarter of the budget for one request's intermediates, half for cached aggregates
+        self.budget = int(budget_mb * MB)
+        self.request_bytes = self.budget // 4
+        self.aggregate_bytes = self.budget // 2
+        self.spill_dir = spill_dir
+
+        # process peak RSS while each running callback runs, and per callback totals
+        self._active = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+        # RSS is sampled in the background so short allocation spikes inside a callback are seen,
+        # the sampler only runs while a callback is being measured
+        self._interval = interval
+        self._sampler = None
+
+    def _sample(self):
+        while True:
+            time.sleep(self._interval)
+            rss = rss_bytes()
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                for token, peak in self._active.items():
+                    self._active[token] = max(peak, rss)
+
+    def cache(self, name, share=1.0):
+        '''
+        Purpose:
+            spill cache for one kind of precomputed aggregate
+
+        Args:
+            name (str): name of the aggregate, used as its spill subdirectory
+            share (float): fraction of the aggregate budget this cache may keep in memory
+
+        Return:
+            SpillCache
+        '''
+
+        return SpillCache(int(self.aggregate_bytes * share), os.path.join(self.spill_dir, name))
+
+    def max_rows(self, bytes_per_row):
+        ''' Rows a request may gather without exceeding its share of the budget '''
+        return max(self.request_bytes // max(bytes_per_row, 1), 1)
+
+    @contextmanager
+    def track(self, label):
+        '''
+        Purpose:
+            measure the process peak RSS while a callback runs and print it, the peak includes
+            any other callback running at the same time
+
+        Args:
+            label (str): callback name
+
+        Return:
+            dict yielded to the block, set its log key to False to skip printing this call,
+            records the peak in self.stats
+        '''
+
+        token = object()
+        record = {'log': True}
+        start = rss_bytes()
+        with self._lock:
+            self._active[token] = start
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        try:
+            yield record
+        finally:
+            end = rss_bytes()
+            with self._lock:
+                peak = max(self._active.pop(token), end)
+                concurrent = len(self._active)
+                stats = self.stats.setdefault(label, {'calls': 0, 'process_peak_mb': 0.0})
+                stats['calls'] += 1
+                stats['process_peak_mb'] = max(stats['process_peak_mb'], peak / MB)
+            if record['log']:
+                shared = f" shared with {concurrent} concurrent callback{'s' if concurrent > 1 else ''}" if concurrent else ""
+                print(f"[memory] {label}: process peak RSS {peak / MB:.1f}MB ({(peak - start) / MB:+.1f}MB){shared}, "
+                      f"budget {self.budget / MB:.0f}MB", flush=True)
+
+    def register_routes(self, server):
+        '''
+        Purpose:
+            serve the process peak RSS seen while each callback ran at /memory.json
+
+        Args:
+            server (Flask): flask server behind the dash app
+
+        Return:
+            None, adds the route to the server
+        '''
+
+        from flask import jsonify
+
+        @server.route('/memory.json')
+        def memory_stats():
+            with self._lock:
+                stats = {label: dict(values) for label, values in self.stats.items()}
+            return jsonify(budget_mb=self.budget / MB, rss_mb=rss_bytes() / MB, callbacks=stats)
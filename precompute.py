@@ -0,0 +1,254 @@
+"""
+@file: precompute.py
+
+Pre-render figures that only depend on the dataset into compressed JSON artifacts
+and serve them back to the dashboard without rebuilding them per callback. The yearly
+bar charts are rendered at startup, the animation set of each offense code group in the
+background after it, and any other animation set the first time it is requested
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# brotli is optional, gzip artifacts are always written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MANIFEST = 'manifest.json'
+
+# prefix of the animation set artifacts, removed when the dataset changes
+ANIMATIONS = 'animations_'
+
+
+def bar_name(year):
+    ''' Artifact name of the bar chart for a year '''
+    return f'bar_{year}'
+
+
+def animation_name(offenses, label):
+    ''' Artifact name of the animation set for a collection of offense code groups, titled with label '''
+    key = '|'.join(sorted(offenses)) + '#' + label
+    return ANIMATIONS + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _write_artifact(out_dir, name, payload):
+    '''
+    Purpose:
+        compress a JSON payload and write it atomically as gzip (and brotli when installed)
+
+    Args:
+        out_dir (str): directory holding the artifacts
+        name (str): artifact name without extension
+        payload (str): serialized JSON
+
+    Return:
+        None, writes files to out_dir
+    '''
+
+    raw = payload.encode('utf-8')
+    encoded = {'gz': gzip.compress(raw, compresslevel=9)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(raw)
+
+    # the gzip copy is written last, its presence marks a complete artifact
+    for ext in sorted(encoded, reverse=True):
+        path = os.path.join(out_dir, f'{name}.json.{ext}')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(encoded[ext])
+        os.replace(tmp, path)
+
+
+def prerender_animations(job_queue, out_dir, groups):
+    '''
+    Purpose:
+        render the animation set of every offense code group in a background worker, one group
+        at a time so requests queue behind at most one pre-render
+
+    Args:
+        job_queue (FigureJobQueue): queue of the figure workers
+        out_dir (str): directory the artifacts are stored in
+        groups (list): offense code groups, each rendered titled with its own name
+
+    Return:
+        None, the workers write the artifacts to out_dir
+    '''
+
+    from jobs import animations_job
+
+    for group in groups:
+        if os.path.exists(os.path.join(out_dir, f'{animation_name([group], group)}.json.gz')):
+            continue
+
+        # same key as a request for the group, so a concurrent request shares the build
+        args = [[group], group, out_dir]
+        try:
+            key = job_queue.submit(json.dumps(['animations'] + args), animations_job, *args)
+        except RuntimeError:
+            # the workers were shut down
+            return
+        try:
+            job_queue.wait(key)
+        except Exception as error:
+            print(f'[precompute] animations for {group} failed: {error!r}', flush=True)
+
+
+def build_artifacts(cr, out_dir, crime_year_offense):
+    '''
+    Purpose:
+        pre-render the yearly bar charts and drop the animation sets of an earlier dataset,
+        skipping the build when the artifacts already match the loaded dataset
+
+    Args:
+        cr (CrimeReport): cleaned crime reports
+        out_dir (str): directory to write the artifacts to
+        crime_year_offense (DataFrame): crime reports grouped by year and offense code group
+
+    Return:
+        dict manifest of the dataset fingerprint and the artifacts written
+    '''
+
+    from figures import make_bar_chart
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    fingerprint = cr.results_fingerprint or cr.fingerprint()
+
+    # artifacts are still valid for this dataset
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('fingerprint') == fingerprint:
+            return manifest
+
+    artifacts = []
+
+    # bar chart for each year
+    for year in crime_year_offense.index.get_level_values('year').unique():
+        bar_chart = make_bar_chart(crime_year_offense.loc[year], year)
+        _write_artifact(out_dir, bar_name(year), bar_chart.to_json())
+        artifacts.append(bar_name(year))
+
+    # animation sets are rendered in the background or when first requested, those of the previous dataset are stale
+    for entry in os.scandir(out_dir):
+        if entry.name.startswith(ANIMATIONS):
+            os.remove(entry.path)
+
+    # manifest is written last so a partial build is never considered valid
+    manifest = {'fingerprint': fingerprint, 'artifacts': artifacts}
+    tmp = f'{manifest_path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+
+    return manifest
+
+
+class FigureStore:
+
+    def __init__(self, out_dir, cache=None, keep=8):
+        """Constructor"""
+
+        # directory of the compressed artifacts
+        self.out_dir = out_dir
+
+        # decompressed figures already requested by a callback, the keep most recently used
+        # unless a SpillCache bounds them by size
+        self._figures = OrderedDict() if cache is None else cache
+        self._keep = keep
+
+        # callbacks run on several threads
+        self._lock = threading.Lock()
+
+    def _path(self, name, ext='gz'):
+        return os.path.join(self.out_dir, f'{name}.json.{ext}')
+
+    def exists(self, name):
+        ''' Whether an artifact was pre-rendered, without loading it '''
+        return name in self._figures or os.path.exists(self._path(name))
+
+    def get(self, name):
+        '''
+        Purpose:
+            load a pre-rendered figure (or list of figures) as plain JSON, bypassing plotly
+
+        Args:
+            name (str): artifact name
+
+        Return:
+            dict/list of the figure JSON, or None if the artifact was not pre-rendered
+        '''
+
+        with self._lock:
+            figure = self._figures.get(name)
+            if figure is not None:
+                if isinstance(self._figures, OrderedDict):
+                    self._figures.move_to_end(name)
+                return figure
+
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            figure = json.loads(f.read())
+
+        with self._lock:
+            self._figures[name] = figure
+
+            # forget the least recently used figures
+            if isinstance(self._figures, OrderedDict):
+                while len(self._figures) > self._keep:
+                    self._figures.popitem(last=False)
+
+        return figure
+
+    def register_routes(self, server):
+        '''
+        Purpose:
+            serve the compressed artifacts at /figures/<name>.json with cache headers
+
+        Args:
+            server (Flask): flask server behind the dash app
+
+        Return:
+            None, adds the route to the server
+        '''
+
+        from flask import Response, abort, request
+
+        @server.route('/figures/<name>.json')
+        def serve_figure(name):
+            name = os.path.basename(name)
+
+            # pick the best encoding the client accepts, decompressing only for clients without gzip
+            for ext, encoding in (('br', 'br'), ('gz', 'gzip')):
+                path = self._path(name, ext)
+                if encoding in request.accept_encodings and os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        response = Response(f.read(), mimetype='application/json')
+                    response.headers['Content-Encoding'] = encoding
+                    break
+            else:
+                figure = self.get(name)
+                if figure is None:
+                    abort(404)
+                response = Response(json.dumps(figure), mimetype='application/json')
+
+            # artifacts only change with the dataset
+            try:
+                with open(os.path.join(self.out_dir, MANIFEST)) as f:
+                    response.set_etag(json.load(f)['fingerprint'] + name)
+            except (OSError, ValueError, KeyError):
+                return response
+            response.headers['Cache-Control'] = 'public, max-age=86400'
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response.make_conditional(request)
@@ -0,0 +1,236 @@
+"""
+@file: result_cache.py
+
+Content-addressed cache of query results on local disk, shared by every dashboard process
+on a host. Results are keyed by the dataset fingerprint plus the query, written atomically
+and evicted least recently used first once the cache outgrows its size, so a freshly
+started worker serves warm aggregates instead of recomputing the same groupbys.
+Each process tracks the size it knows of and only rescans the directory when that crosses
+the limit, so the cache may briefly hold more than max_bytes while several processes write
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+MB = 2 ** 20
+
+# temporary files left behind by a crashed writer are removed after this many seconds
+STALE_TMP = 3600
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir, max_bytes=256 * MB):
+        """Constructor"""
+
+        # one file per result, named by the hash of its key
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # bytes on disk as of the last scan plus the results this process wrote since
+        self._lock = threading.Lock()
+        self._bytes = self._scan()[1]
+
+        # lookups answered by this process
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # worker processes get their own lock and lookup counts, spawned workers cannot receive a lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        state.update(hits=0, misses=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        ''' Content address of a query, parts must have a stable repr across processes '''
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def get(self, key, default=None):
+        '''
+        Purpose:
+            read a cached result, treating files removed or damaged by other processes as missing
+
+        Args:
+            key (str): content address from ResultCache.key
+            default (object): value returned when the result is not cached
+
+        Return:
+            cached result, or default
+        '''
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            self._remove(path)
+            return default
+
+        # reading marks the result as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Purpose:
+            write a result atomically, so concurrent readers only ever see complete files,
+            then evict the least recently used results while the cache is over its size
+
+        Args:
+            key (str): content address from ResultCache.key
+            value (object): picklable result
+
+        Return:
+            None, writes to cache_dir
+        '''
+
+        # a unique temporary name per writer, processes may store the same key at once
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            self._remove(tmp)
+            raise
+
+        # the directory is only scanned once the tracked size crosses the limit
+        with self._lock:
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict(keep=self._path(key))
+
+    def _scan(self):
+        '''
+        Purpose:
+            list the cached results, removing temporary files left behind by crashed writers
+
+        Args:
+            None
+
+        Return:
+            tuple of a list of (mtime, size, path) of every result and their total size
+        '''
+
+        now = time.time()
+        entries, total = [], 0
+        for entry in os.scandir(self.cache_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.tmp'):
+                if now - stat.st_mtime > STALE_TMP:
+                    self._remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        return entries, total
+
+    def _evict(self, keep=None):
+        ''' Remove the least recently used results, except the one just written, until the cache fits in max_bytes '''
+
+        # rescan, other processes write and evict too
+        entries, total = self._scan()
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+        self._bytes = total
+
+    @staticmethod
+    def _remove(path):
+        # another process may have evicted the same file already
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        ''' Remove every cached result '''
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                self._remove(entry.path)
+            self._bytes = 0
+
+
+def cached_result(method):
+    '''
+    Purpose:
+        serve a CrimeReport query from its result cache, keyed by the dataset fingerprint,
+        the backend, whether the data is compacted and the query arguments, computing and
+        storing it on a miss
+
+    Args:
+        method (function): query method, its positions argument only speeds up the
+            computation and is left out of the key, list arguments are selections
+            whose order does not change the result
+
+    Return:
+        wrapped method, unchanged when the report has no result cache
+    '''
+
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'results', None)
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        # bind the arguments so positional, keyword and default calls share one key
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        query = [(name, _plain(value)) for name, value in bound.arguments.items() if name not in ('self', 'positions')]
+
+        # compacted data shares its fingerprint but returns categorical labels
+        key = cache.key(self.results_fingerprint, type(self).__name__, self.compacted, method.__name__, query)
+        value = cache.get(key)
+        if value is None:
+            value = method(self, *args, **kwargs)
+            cache.put(key, value)
+        return value
+
+    return wrapper
+
+
+def _plain(value):
+    ''' Python values for numpy scalars and sorted lists, so a query has the same key whichever caller made it '''
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return sorted((_plain(item) for item in value), key=repr)
+    return value
@@ -6,9 +6,6 @@ J. Rachlin
 """
 
 import plotly.graph_objects as go
-import plotly.io as pio
-
-pio.renderers.default = "browser" # also, close opera!
 
 
 def _code_mapping(df, src, targ):
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_backend import synthetic_data
+
+
+@pytest.fixture(scope='session')
+def reports():
+    ''' Cleaned looking crime reports shared by the tests, do not modify '''
+    return synthetic_data(20000, seed=1)
@@ -0,0 +1,13 @@
+from animations_1 import group_dirs
+
+
+def test_group_dirs():
+    dirs = group_dirs(['M/V Accident', 'M V Accident', 'Larceny', 'Towed'])
+
+    # colliding names get distinct suffixed directories, the others keep their slug
+    assert len(set(dirs.values())) == 4
+    assert dirs['Larceny'] == 'larceny' and dirs['Towed'] == 'towed'
+    assert all(dirs[name].startswith('m_v_accident_') for name in ['M/V Accident', 'M V Accident'])
+
+    # a group keeps its directory across runs
+    assert group_dirs(['M V Accident', 'M/V Accident']) == {name: dirs[name] for name in ['M V Accident', 'M/V Accident']}
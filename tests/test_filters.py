@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from crime_dash_library import CrimeReport
+from filters import ALL_OFFENSES, ALL_STREETS, FilterState, RowSelection
+
+
+# year, offense code groups and streets of each case, None keeps all
+CASES = [(2018, None, None),
+         (2018, ['Offense Group 0', 'Offense Group 3'], None),
+         (2018, ['Offense Group 3', 'Offense Group 0'], ['Street 0', 'Street 1']),
+         (2016, [], None),
+         (2019, ['Offense Group 5'], []),
+         (None, ['Offense Group 1'], None),
+         (2030, None, None)]
+
+
+@pytest.fixture(params=['plain', 'compact'])
+def cr(request, reports):
+    cr = CrimeReport()
+    cr.data = reports.copy()
+    if request.param == 'compact':
+        cr.compact()
+    return cr
+
+
+def _filtered(data, year, offenses, streets):
+    ''' Reports matching the filters, masked from scratch like each figure used to '''
+    keep = pd.Series(True, index=data.index)
+    if year is not None:
+        keep &= data['year'] == year
+    if offenses is not None:
+        keep &= data['offense_code_group'].isin(offenses)
+    if streets is not None:
+        keep &= data['street'].isin(streets)
+    return data[keep]
+
+
+@pytest.mark.parametrize('year, offenses, streets', CASES)
+def test_positions_match_masks(cr, year, offenses, streets):
+    rows = RowSelection(cr)
+
+    # the narrowed subset is resolved after the year subset it is taken from
+    rows.positions(year)
+    positions = rows.positions(year, offenses, streets)
+
+    expected = _filtered(cr.data.reset_index(drop=True), year, offenses, streets).index.to_numpy()
+    np.testing.assert_array_equal(positions, expected)
+
+
+@pytest.mark.parametrize('year, offenses, streets', CASES)
+def test_columns_and_histograms_match_masks(cr, year, offenses, streets):
+    rows = RowSelection(cr)
+    expected = _filtered(cr.data, year, offenses, None)
+
+    columns = rows.columns(['lat', 'long', 'district'], year, offenses)
+    for col, values in columns.items():
+        np.testing.assert_array_equal(values, expected[col].to_numpy())
+
+    # each column of a subset is gathered once per request
+    assert rows.columns(['lat'], year, offenses)['lat'] is columns['lat']
+
+    histograms = rows.histograms(year, offenses)
+    assert histograms['hour'].sum() == len(expected)
+    pd.testing.assert_series_equal(histograms['month'], expected['month'].value_counts().sort_index().rename('count'),
+                                   check_names=False, check_index_type=False)
+
+    assert sorted(rows.offense_groups(year)) == sorted(_filtered(cr.data, year, None, None)['offense_code_group'].unique())
+
+
+def test_columns_thinned_to_max_rows(cr):
+    rows = RowSelection(cr, max_rows=100)
+    expected = _filtered(cr.data, 2018, None, None)
+
+    lat = rows.columns(['lat'], 2018)['lat']
+    assert len(lat) == 100
+    assert lat[0] == expected['lat'].iloc[0] and lat[-1] == expected['lat'].iloc[-1]
+
+
+def test_filter_state_normalizes_dropdowns():
+    filters = FilterState('2018', ALL_OFFENSES, ['Street 1', ALL_STREETS], [])
+    assert filters.year == 2018
+    assert filters.offenses is None and filters.streets is None
+    assert filters.crimes == [] and filters.crime == []
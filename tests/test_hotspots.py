@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hotspots import HotspotEngine
+
+
+GROUPS = ['Offense Group 0', 'Offense Group 1']
+YEAR = (pd.Timestamp('2018-01-01'), pd.Timestamp('2019-01-01'))
+
+
+@pytest.fixture(scope='module')
+def data(reports):
+    # cluster some incidents of the first groups so there are hotspots to find
+    data = reports.copy()
+    rng = np.random.default_rng(2)
+    cluster = data.index[data['offense_code_group'].isin(GROUPS)][::3]
+    data.loc[cluster, 'lat'] = 42.3 + rng.normal(0, 0.004, len(cluster))
+    data.loc[cluster, 'long'] = -71.1 + rng.normal(0, 0.004, len(cluster))
+    return data
+
+
+@pytest.fixture(scope='module')
+def engine(data):
+    return HotspotEngine(data)
+
+
+def _counts(engine, data):
+    ''' Grid of incident counts binned from scratch '''
+    rows = np.floor((data['lat'].to_numpy() - engine.lat_min) / engine.cell_size).astype(int)
+    cols = np.floor((data['long'].to_numpy() - engine.lon_min) / engine.cell_size).astype(int)
+    inside = (rows >= 0) & (rows < engine.shape[0]) & (cols >= 0) & (cols < engine.shape[1])
+    counts = np.zeros(engine.shape)
+    np.add.at(counts, (rows[inside], cols[inside]), 1)
+    return counts
+
+
+def test_grids(engine, data):
+    counts, smoothed = engine.grids(*YEAR)
+    assert counts.shape == smoothed.shape == (len(engine.group_names),) + engine.shape
+
+    in_year = data[(data['datetime'] >= YEAR[0]) & (data['datetime'] < YEAR[1])]
+    for group in GROUPS:
+        num = engine.group_names.get_loc(group)
+        expected = _counts(engine, in_year[in_year['offense_code_group'] == group])
+        assert np.array_equal(counts[num], expected)
+        assert np.allclose(smoothed[num], engine._row_kernel @ expected @ engine._col_kernel.T)
+
+
+def test_hotspots_of_several_groups(engine, data):
+    # the hotspots of several groups are those of the sum of their grids
+    spots = engine.hotspots(GROUPS, *YEAR)
+    assert len(spots) > 0
+
+    in_year = data[(data['datetime'] >= YEAR[0]) & (data['datetime'] < YEAR[1])]
+    count = _counts(engine, in_year[in_year['offense_code_group'].isin(GROUPS)])
+    density = engine._row_kernel @ count @ engine._col_kernel.T
+    occupied = density > 1e-9
+    mean, std = density[occupied].mean(), density[occupied].std()
+    hot = occupied & (density >= mean + engine.threshold * std)
+
+    rows, cols = np.nonzero(hot)
+    expected = pd.DataFrame({'lat': engine.lat_min + (rows + 0.5) * engine.cell_size,
+                             'long': engine.lon_min + (cols + 0.5) * engine.cell_size,
+                             'count': count[rows, cols].astype(int),
+                             'density': density[rows, cols]})
+    expected = expected.sort_values('density', ascending=False, ignore_index=True)
+    pd.testing.assert_frame_equal(spots, expected)
+
+    # selection order does not matter
+    pd.testing.assert_frame_equal(engine.hotspots(GROUPS[::-1], *YEAR), spots)
+
+
+def test_year_hotspots(engine):
+    pd.testing.assert_frame_equal(engine.year_hotspots(2018, GROUPS), engine.hotspots(GROUPS, *YEAR))
+
+
+@pytest.mark.parametrize('year, offenses', [(2030, None), (2030, GROUPS), (2018, []), (2018, ['No Such Group'])])
+def test_empty_hotspots(engine, year, offenses):
+    spots = engine.year_hotspots(year, offenses)
+    assert spots.empty and spots.columns.tolist() == ['lat', 'long', 'count', 'density']
+
+
+def test_empty_year_grids(engine):
+    counts, smoothed = engine.grids(pd.Timestamp('2030-01-01'), pd.Timestamp('2031-01-01'))
+    assert not counts.any() and not smoothed.any()
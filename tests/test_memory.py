@@ -0,0 +1,42 @@
+import os
+import shutil
+
+import numpy as np
+
+from memory import SpillCache
+
+
+def test_spill_and_reload(tmp_path):
+    cache = SpillCache(max_bytes=1000, spill_dir=str(tmp_path))
+    cache['a'] = np.arange(100)
+    cache['b'] = np.arange(100, 200)
+
+    # the least recently used value went to disk and comes back intact
+    assert 'a' in cache and cache.nbytes <= 1000
+    assert np.array_equal(cache['a'], np.arange(100))
+    assert np.array_equal(cache.get('b'), np.arange(100, 200))
+    assert cache.get('c') is None
+
+
+def test_processes_share_spill_dir(tmp_path):
+    # caches of separate processes spill the same keys into their own directories
+    first = SpillCache(max_bytes=1000, spill_dir=str(tmp_path))
+    second = SpillCache(max_bytes=1000, spill_dir=str(tmp_path))
+    for cache, offset in ((first, 0), (second, 1000)):
+        cache['a'] = np.arange(offset, offset + 100)
+        cache['b'] = np.arange(100)
+    assert first._dir != second._dir and os.path.dirname(first._dir) == str(tmp_path)
+
+    # reading a value back removes only that cache's file
+    assert np.array_equal(first['a'], np.arange(100))
+    assert np.array_equal(second['a'], np.arange(1000, 1100))
+
+
+def test_missing_spill_file_is_a_miss(tmp_path):
+    cache = SpillCache(max_bytes=1000, spill_dir=str(tmp_path))
+    cache['a'] = np.arange(100)
+    cache['b'] = np.arange(100)
+    shutil.rmtree(cache._dir)
+
+    assert cache.get('a') is None and 'a' not in cache
+    assert np.array_equal(cache['b'], np.arange(100))
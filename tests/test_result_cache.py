@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crime_dash_library import CrimeReport
+from result_cache import ResultCache
+
+
+def _value(kb):
+    ''' A result of roughly kb kilobytes once pickled '''
+    return np.zeros(kb * 128)
+
+
+def _age(cache, key, seconds):
+    ''' Pretend a result was last used some seconds ago '''
+    path = cache._path(key)
+    when = os.stat(path).st_mtime - seconds
+    os.utime(path, (when, when))
+
+
+def _disk_bytes(cache):
+    return sum(entry.stat().st_size for entry in os.scandir(cache.cache_dir))
+
+
+def _cached(cache, keys):
+    ''' Keys whose results are on disk, checked without marking them as used '''
+    return {key for key in keys if os.path.exists(cache._path(key))}
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=35 * 1024)
+    for age, key in enumerate(['c', 'b', 'a']):
+        cache.put(key, _value(10))
+        _age(cache, key, 100 * (age + 1))
+
+    # reading a marks it as the most recently used, so b is evicted for the new result, then c
+    assert cache.get('a') is not None
+    cache.put('d', _value(10))
+    assert _cached(cache, 'abcd') == set('acd')
+
+    cache.put('e', _value(10))
+    assert _cached(cache, 'abcde') == set('ade')
+    assert _disk_bytes(cache) <= cache.max_bytes
+
+
+def test_stays_within_size_limit(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=50 * 1024)
+    for num in range(40):
+        cache.put(str(num), _value(4))
+        assert _disk_bytes(cache) <= cache.max_bytes
+
+    # a result larger than the whole cache is still kept until the next write
+    cache.put('large', _value(80))
+    assert cache.get('large') is not None
+
+
+def test_scans_only_when_over_the_limit(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), max_bytes=100 * 1024)
+    scans = []
+    original = cache._scan
+    monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or original())
+
+    for num in range(5):
+        cache.put(str(num), _value(10))
+    assert scans == []
+
+    for num in range(5, 12):
+        cache.put(str(num), _value(10))
+    assert scans and _disk_bytes(cache) <= cache.max_bytes
+
+
+def test_damaged_result_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('a', _value(1))
+    with open(cache._path('a'), 'wb') as f:
+        f.write(b'not a pickle')
+
+    assert cache.get('a') is None
+    assert not os.path.exists(cache._path('a'))
+
+
+@pytest.fixture
+def cr(reports, tmp_path):
+    cr = CrimeReport()
+    cr.data = reports.copy()
+    cr.use_results(ResultCache(str(tmp_path)))
+    return cr
+
+
+def test_queries_share_keys_across_call_styles(cr):
+    offenses = ['Offense Group 0', 'Offense Group 3']
+    expected = cr.histograms(2018, offenses)
+
+    # reordered selections, numpy years, keywords and positions all read the same result
+    for result in (cr.histograms(np.int64(2018), offenses[::-1]),
+                   cr.histograms(year=2018, offenses=offenses, positions=cr.positions(2018, offenses))):
+        for name in expected:
+            pd.testing.assert_series_equal(result[name], expected[name])
+    assert cr.results.hits == 2 and cr.results.misses == 1
+
+
+def test_compacted_data_does_not_share_results(cr, reports):
+    cr.year_offense_counts()
+
+    compact = CrimeReport()
+    compact.data = reports.copy()
+    compact.compact()
+    compact.use_results(cr.results)
+    assert compact.results_fingerprint == cr.results_fingerprint
+
+    # the compacted report computes its own counts with a categorical index
+    counts = compact.year_offense_counts()
+    assert cr.results.misses == 2
+    assert isinstance(counts.index.levels[1], pd.CategoricalIndex)
+    assert not isinstance(cr.year_offense_counts().index.levels[1], pd.CategoricalIndex)
+
+
+def _put_and_get(cache, key):
+    ''' Store a result from a worker process and read it back '''
+    cache.put(key, _value(1))
+    return cache.get(key) is not None, cache.hits
+
+
+def test_shared_with_spawned_workers(tmp_path):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    cache = ResultCache(str(tmp_path))
+    cache.get('missing')
+
+    # spawned workers receive the cache pickled, with their own lock and lookup counts
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        assert pool.submit(_put_and_get, cache, 'worker').result() == (True, 1)
+    assert np.array_equal(cache.get('worker'), _value(1))
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from crime_dash_library import CrimeReport, canonical_street
+
+
+# raw street value and its canonical component streets
+PAIRS = [('W BROADWAY', ('West Broadway',)),
+         ('WEST BROADWAY', ('West Broadway',)),
+         ('E BROADWAY', ('East Broadway',)),
+         ('EAST BROADWAY', ('East Broadway',)),
+         ('N WASHINGTON ST', ('North Washington Street',)),
+         ('E ST', ('E Street',)),
+         ('N ST', ('N Street',)),
+         ('ST JAMES AVE', ('Saint James Avenue',)),
+         ('W 4TH ST', ('West 4th Street',)),
+         ('WASHINGTON ST & E ST', ('Washington Street', 'E Street'))]
+
+
+@pytest.mark.parametrize('raw, expected', PAIRS)
+def test_canonical_street(raw, expected):
+    assert canonical_street(raw) == expected
+
+
+def test_letter_streets_stay_apart():
+    assert canonical_street('E ST') != canonical_street('EAST ST')
+
+
+@pytest.fixture
+def cr(reports):
+    cr = CrimeReport()
+    cr.data = reports.copy()
+    cr.data.loc[cr.data.index[:50], 'street'] = 'WASHINGTON ST & E ST'
+    cr.data.loc[cr.data.index[50:100], 'street'] = 'E ST & WASHINGTON ST'
+    cr._normalize_streets()
+    return cr
+
+
+def test_street_ids(cr):
+    # the lookup is sorted by name and every row's id names its street
+    assert cr.streets.is_monotonic_increasing and cr.streets.is_unique
+    assert (cr.streets.to_numpy()[cr.data['street_id'].to_numpy()] == cr.data['street'].to_numpy()).all()
+
+    # an intersection has one id whichever street was reported first
+    assert cr.data['street_id'].iloc[:100].nunique() == 1
+    assert cr.data['street'].iloc[0] == 'E Street & Washington Street'
+    assert cr.data['intersection'].iloc[:100].all() and not cr.data['intersection'].iloc[100:].any()
+
+
+@pytest.mark.parametrize('streets, offenses, min_count', [(None, None, 15),
+                                                          (['Street 0', 'E Street & Washington Street'], None, 0),
+                                                          (['Street 1', 'Street 42'], ['Offense Group 0'], 0)])
+@pytest.mark.parametrize('compact', [False, True])
+def test_street_offense_counts_by_id(cr, streets, offenses, min_count, compact):
+    # grouping on street ids matches grouping on the street names
+    by_name = CrimeReport()
+    by_name.data = cr.data.drop(columns='street_id')
+    if compact:
+        cr.compact()
+        by_name.compact()
+
+    expected = by_name.street_offense_counts(2018, streets, offenses, min_count)
+    result = cr.street_offense_counts(2018, streets, offenses, min_count)
+    key = ['street', 'offense_code_group']
+    pd.testing.assert_frame_equal(result.sort_values(key).reset_index(drop=True),
+                                  expected.sort_values(key).reset_index(drop=True))
+    assert np.array_equal(cr.positions(2018, offenses, streets), by_name.positions(2018, offenses, streets))
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from timeseries import ROLLUPS, CrimeTimeSeries
+
+
+def _assert_same(incremental, full):
+    ''' Every rollup and its rolling stats match a recompute from scratch '''
+    for name in ROLLUPS:
+        pd.testing.assert_frame_equal(incremental.rollup(name), full.rollup(name), check_freq=False)
+        pd.testing.assert_frame_equal(incremental.rolling_mean(name), full.rolling_mean(name), check_freq=False)
+        pd.testing.assert_frame_equal(incremental.zscores(name), full.zscores(name), check_freq=False)
+
+        # spikes with equal z-scores may swap places from float rounding in the rolling window
+        order = ['period', 'offense_code_group', 'district']
+        pd.testing.assert_frame_equal(incremental.spikes(name).sort_values(order, ignore_index=True),
+                                      full.spikes(name).sort_values(order, ignore_index=True))
+
+
+@pytest.fixture
+def ordered(reports):
+    return reports.sort_values('datetime', ignore_index=True)
+
+
+def test_appended_reports_match_full_recompute(ordered):
+    incremental = CrimeTimeSeries(window=7, threshold=2.0, min_count=1)
+
+    # refresh the rollups between batches so only their tails are recomputed
+    for batch in (ordered.iloc[:10000], ordered.iloc[10000:15000], ordered.iloc[15000:19990], ordered.iloc[19990:]):
+        incremental.add(batch)
+        for name in ROLLUPS:
+            incremental.spikes(name)
+
+    full = CrimeTimeSeries(window=7, threshold=2.0, min_count=1)
+    full.add(ordered)
+    _assert_same(incremental, full)
+
+
+def test_late_and_earlier_reports_match_full_recompute(ordered):
+    incremental = CrimeTimeSeries(window=7, threshold=2.0, min_count=1)
+    incremental.add(ordered.iloc[5000:15000])
+    for name in ROLLUPS:
+        incremental.spikes(name)
+
+    # reports inside the history, then before its start, then a new series
+    incremental.add(ordered.iloc[8000:8100])
+    incremental.add(ordered.iloc[:5000])
+    incremental.add(ordered.iloc[15000:].assign(district='Z9'))
+
+    full = CrimeTimeSeries(window=7, threshold=2.0, min_count=1)
+    full.add(pd.concat([ordered.iloc[5000:15000], ordered.iloc[8000:8100], ordered.iloc[:5000],
+                        ordered.iloc[15000:].assign(district='Z9')]))
+    _assert_same(incremental, full)
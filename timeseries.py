@@ -0,0 +1,232 @@
+"""
+@file: timeseries.py
+
+Daily, weekly and monthly crime count rollups per offense code group and district,
+with rolling means and z-score spike flags computed across every series at once.
+New reports are added incrementally, only the affected tail of each rollup is recomputed
+
+@author: laasyapothuganti & anandafrancis
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# resample frequency of each rollup and the period used to find where a bin starts
+ROLLUPS = {'daily': ('D', 'D'), 'weekly': ('W', 'W'), 'monthly': ('MS', 'M')}
+
+# columns identifying one series
+SERIES_COLS = ['offense_code_group', 'district']
+
+
+class CrimeTimeSeries:
+
+    def __init__(self, window=28, threshold=3.0, min_count=3):
+        """Constructor"""
+
+        # number of past periods in the rolling window
+        self.window = window
+
+        # z-score and minimum count for a period to be flagged as a spike
+        self.threshold = threshold
+        self.min_count = min_count
+
+        # daily counts, one column per (offense code group, district) series
+        self.daily = None
+
+        # cached rollups and rolling stats by rollup name
+        self._rollups = {}
+        self._stats = {}
+
+        # earliest day changed since each cached rollup was last refreshed,
+        # NaT when it is up to date and None when it must be rebuilt
+        self._dirty = {}
+
+    def add(self, data):
+        '''
+        Purpose:
+            add crime reports to the daily counts, marking only the changed days for recomputation
+
+        Args:
+            data (DataFrame): cleaned crime reports with datetime, offense_code_group and district columns
+
+        Return:
+            None, updates the daily counts
+        '''
+
+        if len(data) == 0:
+            return
+
+        # count new reports per day and series
+        days = data['datetime'].dt.floor('D').rename('date')
+        counts = data.groupby([days] + SERIES_COLS, observed=True).size().unstack(SERIES_COLS, fill_value=0).sort_index(axis=1)
+        first = counts.index.min()
+
+        if self.daily is None:
+            index = pd.date_range(first, counts.index.max(), freq='D', name='date')
+            self.daily = counts.reindex(index, fill_value=0)
+            self._dirty = {name: None for name in self._rollups}
+            return
+
+        # new series or days before the history start change every stat, so rebuild
+        rebuild = len(counts.columns.difference(self.daily.columns)) > 0 or first < self.daily.index[0]
+
+        index = pd.date_range(min(first, self.daily.index[0]), max(counts.index.max(), self.daily.index[-1]), freq='D', name='date')
+        if rebuild or len(index) != len(self.daily):
+            self.daily = self.daily.reindex(index=index, columns=self.daily.columns.union(counts.columns).sort_values(), fill_value=0)
+
+        # add counts into only the affected days and series
+        rows = self.daily.index.get_indexer(counts.index)
+        cols = self.daily.columns.get_indexer(counts.columns)
+        values = self.daily.to_numpy(copy=True)
+        values[np.ix_(rows, cols)] += counts.to_numpy()
+        self.daily = pd.DataFrame(values, index=self.daily.index, columns=self.daily.columns)
+
+        for name, dirty in self._dirty.items():
+            if rebuild or dirty is None:
+                self._dirty[name] = None
+            else:
+                self._dirty[name] = first if dirty is pd.NaT else min(dirty, first)
+
+    def rollup(self, name='daily'):
+        '''
+        Purpose:
+            counts per period for every series
+
+        Args:
+            name (str): daily, weekly or monthly
+
+        Return:
+            dataframe indexed by period start (week end for weekly) with one column per series
+        '''
+
+        self._refresh(name)
+        return self._rollups[name]
+
+    def _refresh(self, name):
+        '''
+        Purpose:
+            bring a cached rollup and its rolling stats up to date, recomputing only the changed tail
+
+        Args:
+            name (str): daily, weekly or monthly
+
+        Return:
+            None, updates the caches
+        '''
+
+        freq, period = ROLLUPS[name]
+        cached = self._rollups.get(name)
+        dirty = self._dirty.get(name)
+
+        # nothing changed since the last refresh
+        if cached is not None and dirty is pd.NaT:
+            return
+
+        # first bin touched by the new reports, the whole history when rebuilding
+        if cached is None or dirty is None:
+            start = self.daily.index[0]
+            cached = None
+        else:
+            start = dirty.to_period(period).start_time
+
+        # resample only the changed tail and splice it onto the unchanged head
+        tail = self.daily.loc[start:]
+        tail = tail if name == 'daily' else tail.resample(freq).sum()
+        if cached is None:
+            rollup = tail
+        else:
+            rollup = pd.concat([cached[cached.index < tail.index[0]], tail])
+        self._rollups[name] = rollup
+
+        # rolling stats need window + 1 earlier periods to recompute the tail
+        first = rollup.index.get_indexer([tail.index[0]])[0]
+        self._stats[name] = self._rolling(rollup, max(first - self.window - 1, 0), first, self._stats.get(name) if cached is not None else None)
+
+        self._dirty[name] = pd.NaT
+
+    def _rolling(self, rollup, history, first, cached):
+        '''
+        Purpose:
+            rolling mean, std and z-score of each period against the window before it, for all series at once
+
+        Args:
+            rollup (DataFrame): counts per period and series
+            history (int): position of the first period needed to recompute from first
+            first (int): position of the first period whose stats changed
+            cached (dict): previously computed stats, None to compute everything
+
+        Return:
+            dict of mean, std and z dataframes
+        '''
+
+        counts = rollup.iloc[history:]
+
+        # stats of the window before each period, so a spike does not raise its own baseline
+        rolling = counts.rolling(self.window, min_periods=self.window)
+        mean = rolling.mean().shift(1)
+        std = rolling.std().shift(1)
+
+        # vectorized z-scores, a flat history (zero std) never flags
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (counts - mean) / std.where(std > 0)
+
+        stats = {'mean': mean, 'std': std, 'z': z}
+        if cached is None:
+            return stats
+
+        keep = rollup.index[first]
+        return {key: pd.concat([cached[key][cached[key].index < keep], frame.loc[keep:]]) for key, frame in stats.items()}
+
+    def rolling_mean(self, name='daily'):
+        ''' Rolling mean of the window before each period, per series '''
+        self._refresh(name)
+        return self._stats[name]['mean']
+
+    def zscores(self, name='daily'):
+        ''' Z-score of each period against the window before it, per series '''
+        self._refresh(name)
+        return self._stats[name]['z']
+
+    def spikes(self, name='daily'):
+        '''
+        Purpose:
+            list the periods where a series spiked above its rolling baseline
+
+        Args:
+            name (str): daily, weekly or monthly
+
+        Return:
+            dataframe of period, offense_code_group, district, count, mean and z of each spike
+        '''
+
+        self._refresh(name)
+        counts = self._rollups[name]
+        stats = self._stats[name]
+
+        # flag every series at once, then keep only flagged cells
+        flags = (stats['z'].to_numpy() >= self.threshold) & (counts.to_numpy() >= self.min_count)
+        rows, cols = np.nonzero(flags)
+
+        spikes = pd.DataFrame({'period': counts.index[rows],
+                               'offense_code_group': counts.columns.get_level_values(0)[cols],
+                               'district': counts.columns.get_level_values(1)[cols],
+                               'count': counts.to_numpy()[rows, cols],
+                               'mean': stats['mean'].to_numpy()[rows, cols],
+                               'z': stats['z'].to_numpy()[rows, cols]})
+        return spikes.sort_values(['period', 'z'], ascending=[True, False], ignore_index=True)
+
+    def totals(self, name='daily', level='offense_code_group'):
+        '''
+        Purpose:
+            counts per period summed over districts (or over offense code groups)
+
+        Args:
+            name (str): daily, weekly or monthly
+            level (str): offense_code_group or district to keep
+
+        Return:
+            dataframe with one column per value of level
+        '''
+
+        return self.rollup(name).T.groupby(level=level).sum().T